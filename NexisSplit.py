@@ -1,173 +1,1520 @@
-import sys, codecs, os, re
+import sys, codecs, os, re, mmap, locale, hashlib, json, pickle, zlib, argparse
+import glob, io, time, tarfile, zipfile, functools, contextlib, cProfile, pstats
+import tracemalloc, shlex, threading
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+                               as_completed
+from array import array
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime
+try:
+    import resource
+except ImportError:
+    resource = None
+# Only used to look up our peak memory usage, which isn't available on every
+# platform.
 
 months = ["Januar","Februar","März","April","Mai","Juni","Juli","August","September","Oktober","November","Dezember"]
 corpus = "Korpus.TXT"
 regex = "Dokument\ [0-9]{1,3}\ von\ [\0-9]{1,3}"
+dayFirstDate = r"(?P<day>\d{1,2})(?:\.|er)?\s+(?P<month>[^\W\d_]+)\.?\s+" \
+               r"(?P<year>\d{4})"
+monthFirstDate = r"(?P<month>[^\W\d_]+)\.?\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?," \
+                 r"?\s+(?P<year>\d{4})"
+# E.g. "Sonntag, 19. Februar 2015", "jeudi 3 mars 2016" or "1er mars 2016"
+# and "March 3, 2016 Thursday". They're searched for, so a day of the week
+# in front of or behind the date doesn't matter.
+
+def _import_arrow(action):
+    try:
+        import pyarrow, pyarrow.parquet
+    except ImportError:
+        raise ImportError(action + " articles needs pyarrow, install it " \
+                          "with: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+    # Only needed to export articles to Parquet or Arrow, so pyarrow is
+    # imported on the first export instead of with this module.
+
+def _clean_lines(article, BOM):
+    text = []
+    for line in article.split("\n"):
+        if BOM in line:
+            pass
+        elif line.isspace():
+            pass
+        elif line == "":
+            pass
+        # Don't append the BOM so in case we process the same article multiple
+        # times the BOMs don't multiply (it is added later at each file save).
+        # Also don't append empty lines.
+
+        else:
+            text.append(line.rstrip())
+    return text
+
+def _encode_pattern(regex, encoding):
+    # Turn our compiled regex into one that matches the raw bytes of a corpus
+    # file.
+    return re.compile(regex.pattern.encode(encoding), regex.flags & ~re.UNICODE)
+
+def _parse_chunk(job):
+    pattern, BOM, profile, chunk, profiler = job
+    if type(chunk) == tuple:
+        path, start, end, encoding = chunk
+        with open(path, "rb") as f:
+            f.seek(start)
+            chunk = f.read(end - start).decode(encoding)
+    # Chunks of a corpus file are read by the worker itself, so the parent
+    # process doesn't have to pass the text on.
+
+    splitChunk, cleanLines, parseArticle = re.split, _clean_lines, \
+                                           LexisNexisArticle
+    if profiler is not None:
+        splitChunk = profiler._timed("regex_split", splitChunk)
+        cleanLines = profiler._timed("filter_lines", cleanLines)
+        parseArticle = profiler._timed("parse_metadata", parseArticle)
+    articles = LexisNexisArticleStore()
+    for article in splitChunk(pattern, chunk)[1:]:
+        articles.append(parseArticle(cleanLines(article, BOM), profile))
+    # Every chunk starts right at a match of our regex, so just like in
+    # LexisNexisSplitter._split_corpus() the first element is empty.
+
+    if profiler is not None:
+        profiler._stop_hooks()
+    return articles, profiler
+    # A store is handed back as a few flat buffers, unpickling a list of
+    # articles object by object took our parent process about as long as
+    # parsing them all by itself. The profiler goes back too, so our parent
+    # can add up what its workers have recorded.
+
+def _fingerprint(article):
+    # Identify an article by its content, no matter which export or position
+    # it came from.
+    return hashlib.blake2b("\n".join([article.medium or "", article.date or \
+        ""] + article.text).encode("utf-8", "surrogatepass"), \
+        digest_size=16).digest()
+
+def _expand_corpora(corpora):
+    if type(corpora) == str:
+        corpora = [corpora]
+    paths = []
+    for corpus in corpora:
+        if os.path.isdir(corpus):
+            paths.extend(sorted(os.path.join(corpus, fileName) for fileName \
+                in os.listdir(corpus) if not fileName.startswith(".") and \
+                os.path.isfile(os.path.join(corpus, fileName))))
+        elif glob.has_magic(corpus):
+            paths.extend(sorted(path for path in glob.glob(corpus) \
+                                if os.path.isfile(path)))
+        else:
+            paths.append(corpus)
+    # Accept single files, directories (every file inside of them) and glob
+    # patterns like "exports/*.TXT", in any combination.
+
+    if len(paths) == 0:
+        raise ValueError("No corpus files found in: " + ", ".join(corpora))
+    return paths
+
+def _read_sample(path, size=65536):
+    with codecs.open(path, "r") as f:
+        return f.read(size)
+
+def _detect_profile(sample, default="de"):
+    scores = dict.fromkeys(profiles, 0)
+    for match in _detection_pattern().finditer(sample):
+        scores[match.lastgroup] += 1
+    best = max(scores, key=scores.get)
+    if scores[best] == 0:
+        return profiles[default]
+    return profiles[best]
+    # Count the article boundaries of every profile in the first few KB of
+    # a corpus in a single pass, the profile with the most of them wins.
+    # Without any the corpus most likely is a German one we can't split
+    # anyway.
+
+def _detection_pattern():
+    global detectionPattern
+    if detectionPattern is None:
+        detectionPattern = re.compile("|".join("(?P<%s>%s)" % (name, \
+            profile.boundary.pattern) for name, profile in profiles.items()))
+    return detectionPattern
+
+def _iter_source(path, profile, profiler=None):
+    splitter = LexisNexisSplitter(None, path, None, stream=True, \
+                                  profiler=profiler, profile=profile)
+    for position, article in enumerate(splitter._iter_articles()):
+        article.sourceFile = path
+        article.sourcePosition = position
+        yield article
+    # Tag every article with the file it came from and its position in
+    # there.
+
+def _parse_source(job):
+    path, profile, profiler = job
+    articles = list(_iter_source(path, profile, profiler))
+    if profiler is not None:
+        profiler._stop_hooks()
+    return articles, profiler
+
+def _profiled(stage, articles=None, bytes=None):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.profiler is None:
+                return method(self, *args, **kwargs)
+            with self.profiler._stage(stage) as record:
+                result = method(self, *args, **kwargs)
+            if articles is not None:
+                record["articles"] += articles(self, result)
+            if bytes is not None:
+                record["bytes"] += bytes(self, result)
+            return result
+        return wrapper
+    return decorator
+    # Record a method as a stage of our LexisNexisProfiler, articles and bytes
+    # are functions that count what the method has handled once it is done,
+    # outside of the time the stage took.
+
+class LexisNexisParseError(ValueError):
+    pass
+
+class LexisNexisCancelled(Exception):
+    pass
+    # Raise this from a progress callback to stop the splitter midway.
 
 class LexisNexisSplitter():
-    def __init__(self, regex, corpus, months):
+    def __init__(self, regex, corpus, months, stream=False, index=False, \
+                 workers=1, profiler=None, compact=False, dedup=None, \
+                 profile=None):
         super(LexisNexisSplitter, self).__init__()
         self.regex = regex
+        self.profiler = profiler
+        self.compact = compact
+        # Compact splitters keep their articles in a LexisNexisArticleStore
+        # instead of a list of LexisNexisArticles.
+
+        if dedup not in [None, "flag", "collapse", "drop"]:
+            raise ValueError("dedup must be None, 'flag', 'collapse' or " \
+                             "'drop'")
+        self.dedup = dedup
+        self.deduplicator = None
+        if dedup is not None:
+            self.deduplicator = LexisNexisDeduplicator()
+        # Find exact and near duplicates (e.g. agency wires reprinted by
+        # several media) while splitting, either only to flag them, to flag
+        # them but group, count and save only the first article of every
+        # cluster ("collapse") or to drop all but the first article of every
+        # cluster. Replace deduplicator before splitting to use other
+        # settings.
+        self.corpusPath = None
+        self.corpusSize = None
+        self.index = index
+        if workers is None or workers < 1:
+            workers = os.cpu_count()
+        self.workers = workers
+        # The number of processes _split_corpus() parses articles with, None
+        # or 0 means one per core.
+
+        self.progress = None
+        # Optionally a function taking the name of a stage and how many
+        # articles it has handled so far, e.g. to update a progress bar.
+
         if type(corpus) == str:
+            self.corpusPath = corpus
             with codecs.open(corpus, "r") as f:
-                self.corpus = f.readlines()
+                firstLine = f.readline()
+            self.corpus = None
+            self.loadCorpus = not (stream is True or index is True or \
+                                   self.workers > 1)
+        # Only remember where the corpus lives and peek at its first line for
+        # the BOM. In streaming or index mode the articles are read
+        # incrementally by _iter_articles() or mapped into memory by
+        # LexisNexisArticleIndex later on, our workers read their chunks of
+        # the file themselves. Otherwise the corpus is loaded into a list
+        # once it's split, which a cache hit never needs.
+
         elif type(corpus) == list:
             self.corpus = corpus
+            self.loadCorpus = False
         else:
             raise ValueError("Call LexisNexisSplitter like this:\nLexisNexisSplitter('regular expression', 'corpus' (either as path to file or already loaded into a list), 'months' (as a list of strings)")
         # Expect either an already loaded corpus (list) or a (str) as path
         # in case the splitter is invoked from the GUI or from command line.
         # If corpus references to neither a string nor a list, raise an error.
 
-        self.BOM = self.corpus[0].rstrip()
+        if self.corpus is not None:
+            firstLine = self.corpus[0]
+        self.BOM = firstLine.rstrip()
         # Save the byte order mark because we'll be splitting the corpus into
         # smaller portions and every one of those needs to have the BOM in the
         # start of its byte stream or other applications might have to guess
         # the encoding and will probably be wrong.
 
-        self.regex = re.compile(regex)
-        self.monthsConversionTable = {str(months[i]).zfill(2): i+1 \
-                                      for i in range(len(months))}
+        self.autoDetect = profile == "auto" or (profile is None and \
+                                                regex is None)
+        if isinstance(profile, LexisNexisProfile):
+            self.profile = profile
+        elif profile in profiles:
+            self.profile = profiles[profile]
+        elif self.autoDetect is True:
+            if self.corpus is None:
+                sample = _read_sample(self.corpusPath)
+            else:
+                sample = "".join(self.corpus[:1000])[:65536]
+            self.profile = _detect_profile(sample)
+        else:
+            self.profile = LexisNexisProfile("custom", regex, months)
+        # Either one of our built-in profiles (by name), one detected from
+        # the start of the corpus ("auto", or neither regex nor profile
+        # given) or one made of the regex and months we've been handed.
+
+        self.regex = self.profile.boundary
+        self.months = self.profile.months
+        self.monthsConversionTable = self.profile.monthsConversionTable
+        self.errors = LexisNexisErrorReport()
+        # Articles whose headers we couldn't make sense of end up in here
+        # once they're grouped by date.
+
+    def _stage(self, stage):
+        if self.profiler is None:
+            return contextlib.nullcontext({})
+        return self.profiler._stage(stage)
 
+    def _timed(self, stage, function):
+        if self.profiler is None:
+            return function
+        return self.profiler._timed(stage, function)
+        # Without a profiler the function is used as it is, so there's no
+        # overhead at all.
+
+    def _worker_profiler(self):
+        if self.profiler is None:
+            return None
+        return LexisNexisProfiler(self.profiler.hookStage, \
+                                  self.profiler.hookTool)
+        # A profiler of its own for every job of our worker processes.
+
+    def _merge_profiler(self, profiler):
+        if profiler is not None:
+            self.profiler._merge(profiler)
+
+    def _new_articles(self):
+        if self.compact is True:
+            return LexisNexisArticleStore()
+        return []
+
+    def _corpus_size(self):
+        if self.corpusPath is not None:
+            return os.path.getsize(self.corpusPath)
+        if self.corpusSize is None:
+            encoding = locale.getpreferredencoding(False)
+            self.corpusSize = sum(len(line.encode(encoding, "replace")) for \
+                                  line in self.corpus)
+        return self.corpusSize
+        # Corpora handed to us as a list are counted in the bytes they'd take
+        # up in a file, not in characters, but only once.
+
+    @_profiled("split", articles=lambda self, result: len(self.articles), \
+               bytes=lambda self, result: self._corpus_size())
     def _split_corpus(self):
-        splitCorpus = re.split(self.regex, "".join(self.corpus))[1:]
+        self._split_articles()
+        if self.deduplicator is not None:
+            self._deduplicate_articles()
+
+    def _read_corpus(self):
+        with self._stage("read") as record:
+            with codecs.open(self.corpusPath, "r") as f:
+                self.corpus = f.readlines()
+        record["bytes"] = os.path.getsize(self.corpusPath)
+        self.loadCorpus = False
+
+    def _split_articles(self):
+        if self.loadCorpus is True:
+            self._read_corpus()
+        if self.corpus is None and self.index is True:
+            self.articles = LexisNexisArticleIndex(self.corpusPath, \
+                        self.BOM, self.profile)
+            self._report("split", len(self.articles), force=True)
+            return
+        # In index mode only the offsets of each article are recorded, the
+        # articles themselves are decoded once they are accessed.
+
+        if self.workers > 1:
+            self._split_corpus_parallel()
+            self._report("split", len(self.articles), force=True)
+            return
+
+        if self.corpus is None:
+            self.articles = self._new_articles()
+            for article in self._iter_articles():
+                self.articles.append(article)
+                self._report("split", len(self.articles))
+            self._report("split", len(self.articles), force=True)
+            return
+        # A streamed corpus was never loaded as a whole, so collect the
+        # articles from the generator instead. Add them one by one, so others
+        # can already look at the first articles while we're still parsing.
+
+        with self._stage("regex_split"):
+            splitCorpus = re.split(self.regex, "".join(self.corpus))[1:]
         # Don't save the first element because it's BEFORE the first
         # article (meaning only the BOM and some empty lines)
 
-        self.articles = []
+        cleanLines = self._timed("filter_lines", _clean_lines)
+        parseArticle = self._timed("parse_metadata", LexisNexisArticle)
+        self.articles = self._new_articles()
         for article in splitCorpus:
-            text = []
-            for line in article.split("\n"):
-                if self.BOM in line:
-                    pass
-                elif line.isspace():
-                    pass
-                elif line == "":
-                    pass
-                # Don't append the BOM so in case we process the same
-                # article multiple times the BOMs don't multiply (it is
-                # added later at each file save). Also don't append empty
-                # lines.
-                    
+            self.articles.append(parseArticle(cleanLines(article, self.BOM), \
+                                              self.profile))
+            self._report("split", len(self.articles))
+        self._report("split", len(self.articles), force=True)
+
+    def _start_deduplication(self):
+        self.deduplicator._clear()
+        self.clusterIds = array("q")
+        self.duplicates = array("b")
+        self.droppedDuplicates = 0
+
+    def _deduplicate(self, articles):
+        add = self._timed("dedup", self.deduplicator._add)
+        for article in articles:
+            cluster, duplicate = add(article.text)
+            if duplicate and self.dedup == "drop":
+                self.droppedDuplicates += 1
+                continue
+            self.clusterIds.append(cluster)
+            self.duplicates.append(duplicate)
+            yield article
+        # clusterIds and duplicates run parallel to our articles, the first
+        # article of a cluster is the only one that isn't a duplicate.
+
+    def _deduplicate_articles(self):
+        self._start_deduplication()
+        articles = self.articles
+        if self.dedup == "drop":
+            self.articles = self._new_articles()
+            self.articles.extend(self._deduplicate(articles))
+        else:
+            for article in self._deduplicate(articles):
+                pass
+
+    def _unique_articles(self):
+        if getattr(self, "duplicates", None) is None:
+            return self.articles
+        return [article for article, duplicate in zip(self.articles, \
+                self.duplicates) if not duplicate]
+        # One article per cluster, e.g. to save or count reprinted articles
+        # only once when they were merely flagged.
+
+    def _counted_articles(self):
+        if self.dedup == "collapse":
+            return self._unique_articles()
+        return self.articles
+        # What we group, count and save unless we're handed other articles.
+
+    def _report(self, stage, count, force=False):
+        if self.progress is not None and (force or count % 100 == 0):
+            self.progress(stage, count)
+        # Only call back every hundred articles, so reporting doesn't slow
+        # the work itself down.
+
+    def _split_corpus_parallel(self):
+        encoding = locale.getpreferredencoding(False)
+        if self.corpus is None:
+            with open(self.corpusPath, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    boundaries, length = [], 0
                 else:
-                    text.append(line.rstrip())
-            self.articles.append(LexisNexisArticle(text, \
-                                                   self.monthsConversionTable))
-
-    def _group_articles_by_date(self):
-        self.articlesByDate = {}
-        self.earliestDate = "99999999"
-        self.latestDate = "00000000"
+                    with mmap.mmap(f.fileno(), 0, \
+                                   access=mmap.ACCESS_READ) as corpus:
+                        boundaries = [match.start() for match in \
+                            _encode_pattern(self.regex, encoding) \
+                            .finditer(corpus)]
+                        length = len(corpus)
+        else:
+            corpus = "".join(self.corpus)
+            boundaries = [match.start() for match in \
+                          self.regex.finditer(corpus)]
+            length = len(corpus)
+        # Find where each article starts, that's the only part of the work
+        # left to the parent process.
+
+        chunkSize = max(1, -(-len(boundaries) // (self.workers * 4)))
+        starts = boundaries[::chunkSize]
+        ends = starts[1:] + [length]
+        jobs = []
+        for start, end in zip(starts, ends):
+            if self.corpus is None:
+                chunk = (self.corpusPath, start, end, encoding)
+            else:
+                chunk = corpus[start:end]
+            jobs.append((self.regex, self.BOM, self.profile, chunk, \
+                         self._worker_profiler()))
+        # Cut the corpus into a few more chunks than we have workers, each
+        # aligned to article boundaries, so a slow chunk doesn't keep the
+        # other workers waiting.
+
+        store = LexisNexisArticleStore()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for articles, profiler in executor.map(_parse_chunk, jobs):
+                store.extend(articles)
+                self._merge_profiler(profiler)
+                self._report("split", len(store), force=True)
+        # executor.map() hands back the results in the order of our jobs,
+        # so the articles keep their original order.
+
+        if self.compact is True:
+            self.articles = store
+        else:
+            self.articles = list(store)
+        # Without compact mode we hold a list all the same, but of views on
+        # the store our workers filled instead of articles rebuilt one by
+        # one.
+
+    def _iter_articles(self):
+        if self.corpus is None:
+            lines = codecs.open(self.corpusPath, "r")
+        else:
+            lines = iter(self.corpus)
+        # Read the file line by line when streaming, otherwise walk the
+        # already loaded list.
+
+        splitLine = self._timed("regex_split", self.regex.split)
+        cleanLines = self._timed("filter_lines", _clean_lines)
+        parseArticle = self._timed("parse_metadata", LexisNexisArticle)
+        article = None
+        try:
+            for line in lines:
+                pieces = splitLine(line)
+                if article is not None:
+                    article.append(pieces[0])
+                for piece in pieces[1:]:
+                    if article is not None:
+                        yield parseArticle(cleanLines("".join(article), \
+                                                      self.BOM), self.profile)
+                    article = [piece]
+            # Every match of our regex closes the current article and opens
+            # the next one. Everything before the first match is skipped,
+            # just like in _split_corpus(). This assumes that a boundary never
+            # spans more than one line, so only the largest article has to
+            # fit into memory at once.
+
+            if article is not None:
+                yield parseArticle(cleanLines("".join(article), self.BOM), \
+                                   self.profile)
+        finally:
+            if self.corpus is None:
+                lines.close()
+
+    @_profiled("group_by_date", articles=lambda self, result: \
+               sum(len(group) for group in self.articlesByDate.values()))
+    def _group_articles_by_date(self, articles=None, update=False):
+        if articles is None:
+            articles = self._counted_articles()
+        # Group our own articles unless we're handed others, e.g. a stream
+        # from _iter_articles().
+
+        if update is False or not hasattr(self, "articlesByDate"):
+            self.articlesByDate = {}
+            self.earliestDate = "99999999"
+            self.latestDate = "00000000"
+            self.errors = LexisNexisErrorReport()
         # Create two lists to store the date of our first and last article,
         # which we might need if our corpus doesn't contain an article on each
         # date and we don't want gaps in our graphs later (e.g.: we will
-        # generate a range of dates ourselves).
+        # generate a range of dates ourselves). When updating, add the
+        # articles to our existing groups instead.
         
-        for article in self.articles:
+        for article in articles:
             if article.date in self.articlesByDate.keys():
                 self.articlesByDate[article.date].append(article)
             else:
                 self.articlesByDate[article.date] = [article]
             # If a key sure already exists, add our article to that key, if
             # not, add the key and then the article.
+
+            if article.date is None:
+                self.errors._add("date", getattr(article, "error", \
+                                 "Malformed header"), article)
+                continue
+            # Articles whose date we couldn't parse are grouped under None and
+            # reported, but they can't tell us anything about our range.
             
             if article.date < self.earliestDate:
                 self.earliestDate = article.date
-            elif article.date > self.latestDate:
+            if article.date > self.latestDate:
                 self.latestDate = article.date
             # Update earliestDate and latestDate if we find an earlier or later
             # date.
         
-    def _group_articles_by_medium(self):
-        self.articlesByMedium = {}
-        for article in self.articles:
+    def _collect_errors(self, articles=None):
+        if articles is None:
+            articles = self.articles
+        self.errors = LexisNexisErrorReport()
+        for article in articles:
+            if article.date is None:
+                self.errors._add("date", getattr(article, "error", \
+                                 "Malformed header"), article)
+        return self.errors
+        # The same report _group_articles_by_date() fills, for articles
+        # that haven't been grouped.
+
+    @_profiled("group_by_medium", articles=lambda self, result: \
+               sum(len(group) for group in self.articlesByMedium.values()))
+    def _group_articles_by_medium(self, articles=None, update=False):
+        if articles is None:
+            articles = self._counted_articles()
+        if update is False or not hasattr(self, "articlesByMedium"):
+            self.articlesByMedium = {}
+        for article in articles:
             if article.medium in self.articlesByMedium.keys():
                 self.articlesByMedium[article.medium].append(article)
             else:
                 self.articlesByMedium[article.medium] = [article]
 
-    def _prepare_frequency_plotting(self):
-        dateRange = pd.date_range(start=self.earliestDate, \
-                                  end=self.latestDate, freq="D")
-        # Build a dateRange over entire duration of our corpus as our index
-        # for the x-axis and to catch dates on which zero articles were
-        # published.
-        
-        articlesPerDay = []
-        for date in dateRange:
-            dateKey = "".join([str(date.year), str(date.month).zfill(2), \
-                               str(date.day).zfill(2)])
-            if dateKey in self.articlesByDate.keys():
-                articlesPerDay.append(len(self.articlesByDate[dateKey]))
-            else:
-                articlesPerDay.append(0)
-        self.df = pd.DataFrame(articlesPerDay, \
-                    index=dateRange, columns=["articles"])
-        # Create a DataFrame object from our articles per day, using the date
-        # time indexes as an index.
+    @_profiled("query", articles=lambda self, result: len(result))
+    def _query_articles(self, start=None, end=None, media=None):
+        queryIndex = getattr(self, "queryIndex", None)
+        if queryIndex is None or queryIndex.articles is not self.articles or \
+           len(queryIndex) != len(self.articles):
+            with self._stage("query_index"):
+                self.queryIndex = LexisNexisQueryIndex(self.articles)
+        if self.dedup != "collapse":
+            return self.queryIndex._query(start, end, media)
+        positions = self.queryIndex._positions(start, end, media)
+        positions = positions[np.frombuffer(self.duplicates, np.int8) \
+                              [positions] == 0]
+        return [self.articles[i] for i in positions]
+        # E.g. _query_articles("20160301", "20160630", ["Die Welt", "taz"])
+        # for all articles of these two media from March to June 2016. The
+        # index is built on the first query and again once articles were
+        # added. What comes back can be handed to _save_articles() or
+        # _prepare_frequency_plotting() as articles.
+
+    @_profiled("frequency", articles=lambda self, result: \
+               int(self.df["articles"].sum()))
+    def _prepare_frequency_plotting(self, articles=None):
+        if articles is None:
+            articles = self._counted_articles()
+        dates = []
+        media = []
+        for article in articles:
+            dates.append(article.date)
+            media.append(article.medium)
+        # The only loop over our articles, everything below works on whole
+        # arrays at once.
+
+        self.df, self.dfByMedium = self._count_articles(dates, media)
+        self._resample_frequencies()
+
+    def _count_articles(self, dates, media):
+        dateCodes, uniqueDates = pd.factorize(pd.Series(dates, dtype=object))
+        uniqueDays = pd.to_datetime(pd.Series(uniqueDates, dtype=object), \
+                            format="%Y%m%d", errors="coerce").to_numpy()
+        uniqueDays = np.append(uniqueDays, np.datetime64("NaT"))
+        days = uniqueDays[dateCodes]
+        valid = ~np.isnat(days)
+        days = days[valid].astype("datetime64[D]")
+        # There are far fewer distinct dates than articles, so only convert
+        # each of them once. Dates we couldn't make sense of (e.g. an unknown
+        # month) can't be counted, missing ones are factorized to -1 and so
+        # end up as the NaT we've appended.
+
+        if len(days) == 0:
+            return pd.DataFrame({"articles": []}, dtype="int64", \
+                                index=pd.DatetimeIndex([])), \
+                   pd.DataFrame({"date": pd.DatetimeIndex([]), "medium": [], \
+                                 "articles": []})
+        first = days.min()
+        offsets = (days - first).astype(np.int64)
+        span = int(offsets.max()) + 1
+        dateRange = pd.date_range(start=first, periods=span, freq="D")
+        # Number every day from our earliest date on, so a day's count is
+        # just a bin of np.bincount().
+
+        daily = pd.DataFrame(np.bincount(offsets, minlength=span), \
+                             index=dateRange, columns=["articles"])
+        # Days on which zero articles were published end up with an empty
+        # bin, so the range has no gaps.
+
+        codes, uniques = pd.factorize(np.asarray(media, dtype=object)[valid])
+        pairs, counts = np.unique(offsets * len(uniques) + codes, \
+                                  return_counts=True)
+        byMedium = pd.DataFrame({"date": dateRange[pairs // len(uniques)], \
+                                 "medium": uniques[pairs % len(uniques)], \
+                                 "articles": counts})
+        # Count every combination of day and medium that occurs at all. A
+        # long table like this stays small even for thousands of media over
+        # decades, _frequency_by_medium() turns it into columns on demand.
+
+        return daily, byMedium
+
+    def _resample_frequencies(self):
+        self.dfWeekly = self.df.resample("W").sum()
+        self.dfMonthly = self.df.resample("MS").sum()
+        # Weeks end on Sundays, months are labelled with their first day.
+
+    def _frequency_by_medium(self, media=None, freq="D"):
+        # One column per medium (or just the ones asked for) over our whole
+        # range of dates, resampled to freq, e.g. "W" or "MS".
+        byMedium = self.dfByMedium
+        if media is not None:
+            byMedium = byMedium[byMedium["medium"].isin(media)]
+        wide = byMedium.pivot_table(index="date", columns="medium", \
+                    values="articles", aggfunc="sum", fill_value=0) \
+                    .reindex(self.df.index, fill_value=0)
+        if freq != "D":
+            wide = wide.resample(freq).sum()
+        return wide
+
+    def _update_frequency(self, articles):
+        daily, byMedium = self._count_articles( \
+                [article.date for article in articles], \
+                [article.medium for article in articles])
+        self.df = self.df.add(daily, fill_value=0).astype("int64")
+        self.df = self.df.reindex(pd.date_range(start=self.df.index.min(), \
+                    end=self.df.index.max(), freq="D"), fill_value=0)
+        self.dfByMedium = pd.concat([self.dfByMedium, byMedium]) \
+            .groupby(["date", "medium"], as_index=False, sort=False)["articles"] \
+            .sum()
+        self._resample_frequencies()
+        # Only count the new articles and add them to what we already have,
+        # the old counts stay as they are.
 
-    def _save_articles(self, mode="byNumber", path=None, docSeparator=None):
+    @_profiled("update", articles=lambda self, result: len(result))
+    def _update_corpus(self, corpus=None):
+        if corpus is None:
+            source = self
+        else:
+            source = LexisNexisSplitter(None, corpus, None, \
+                                        stream=type(corpus) == str, \
+                                        profile=self.profile)
+        # Without a corpus of its own, read our own corpus again (e.g. when a
+        # splitter on today's export was handed the fingerprints of the
+        # previous exports via _load_fingerprints()).
+
+        if not hasattr(self, "articles"):
+            self.articles = self._new_articles()
+        elif not isinstance(self.articles, (list, LexisNexisArticleStore)):
+            self.articles = list(self.articles)
+        if not hasattr(self, "fingerprints"):
+            self.fingerprints = set(_fingerprint(article) for article \
+                                    in self.articles)
+        # Articles we already hold are never added twice.
+
+        newArticles = []
+        for article in source._iter_articles():
+            fingerprint = _fingerprint(article)
+            if fingerprint not in self.fingerprints:
+                self.fingerprints.add(fingerprint)
+                newArticles.append(article)
+        # Overlapping exports share most of their articles, those are
+        # dropped right after parsing so grouping and saving only ever
+        # see the new ones.
+
+        if self.deduplicator is not None:
+            if getattr(self, "clusterIds", None) is None:
+                self._start_deduplication()
+            newArticles = list(self._deduplicate(newArticles))
+        # New articles are compared with everything we've seen before.
+
+        if len(newArticles) == 0:
+            return newArticles
+        self.articles.extend(newArticles)
+        if isinstance(self.articles, LexisNexisArticleStore):
+            newArticles = [self.articles[i] for i in range(len(self.articles) \
+                           - len(newArticles), len(self.articles))]
+        # Group the stored articles rather than the parsed ones, so our store
+        # is all that holds them.
+
+        if self.dedup == "collapse":
+            newArticles = [article for article, duplicate in zip(newArticles, \
+                           self.duplicates[len(self.duplicates) - \
+                           len(newArticles):]) if not duplicate]
+        # Duplicates are kept, but neither grouped nor saved.
+
+        self._group_articles_by_date(newArticles, update=True)
+        self._group_articles_by_medium(newArticles, update=True)
+        if hasattr(self, "df"):
+            self._update_frequency(newArticles)
+        else:
+            self._prepare_frequency_plotting()
+        return newArticles
+
+    def _load_fingerprints(self, path):
+        if not hasattr(self, "fingerprints"):
+            self.fingerprints = set()
+        try:
+            with open(os.path.join(path, ".fingerprints"), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        for i in range(0, len(data), 16):
+            self.fingerprints.add(data[i:i+16])
+        # Learn about the articles an earlier run already saved to path.
+
+    def _process_corpus(self, cache=None, mode=None, path=None, \
+                        docSeparator=None, container="files"):
+        if cache is not None:
+            with self._stage("cache_load"):
+                key = cache._key(self)
+                state = cache._load(key)
+            if state is not None:
+                self._restore_state(state)
+                self._report("split", len(self.articles), force=True)
+                if mode is not None:
+                    self._save_articles(mode, path, docSeparator, \
+                                        container=container)
+                return
+        # Reuse the results of an earlier run on the very same corpus, regex
+        # and months if our cache still holds them.
+
+        self._split_corpus()
+        self._group_and_count()
+        if cache is not None:
+            with self._stage("cache_store"):
+                cache._store(key, self._dump_state())
+        if mode is not None:
+            self._save_articles(mode, path, docSeparator, container=container)
+
+    def _group_and_count(self):
+        articles = self._counted_articles()
+        if not isinstance(articles, list):
+            articles = list(articles)
+        self._group_articles_by_date(articles)
+        self._group_articles_by_medium(articles)
+        self._report("group", len(self.articles), force=True)
+        self._prepare_frequency_plotting(articles)
+        self._report("frequency", len(self.articles), force=True)
+        # Walk an index or a store only once, so both groupings and our
+        # frequencies share one object per article. A lazy article decodes
+        # its date and medium line just once that way, too.
+
+    def _article_index(self):
+        if isinstance(self.articles, LexisNexisArticleIndex):
+            return self.articles
+        if len(self.articles) > 0 and isinstance(self.articles[0], \
+                                                 LexisNexisLazyArticle):
+            return self.articles[0].index
+        return None
+        # The index our articles live in, also when duplicates were dropped
+        # from it and we only hold a list of some of its articles.
+
+    def _dump_state(self):
+        index = self._article_index()
+        positions = {}
+        if index is not None:
+            articles = {"starts": index.starts, "ends": index.ends, \
+                        "mediumLines": index.mediumLines, \
+                        "dateLines": index.dateLines, "numbers": None}
+            if self.articles is not index:
+                articles["numbers"] = array("q", (article.number for \
+                                                  article in self.articles))
+                positions = {id(article): i for i, article in \
+                             enumerate(self.articles)}
+        # An index is cached as the offsets of its articles, the corpus
+        # itself stays where it is and is mapped again on a hit.
+
+        elif isinstance(self.articles, LexisNexisArticleStore):
+            articles = self.articles
+        else:
+            articles = LexisNexisArticleStore()
+            articles.extend(self.articles)
+            positions = {id(article): i for i, article in \
+                         enumerate(self.articles)}
+        # Everything else is cached as a store, a few flat buffers instead
+        # of one pickled object per article.
+
+        def position(article):
+            if id(article) in positions:
+                return positions[id(article)]
+            return article.number
+
+        def codes(groups):
+            groupCodes = np.full(len(self.articles), -1, dtype=np.int32)
+            for code, group in enumerate(groups.values()):
+                groupCodes[[position(article) for article in group]] = code
+            return list(groups.keys()), groupCodes
+        # Store our groupings as the number of every article's group, so
+        # every article ends up in the cache exactly once. Articles that
+        # weren't grouped (e.g. collapsed duplicates) get -1.
+
+        return {"articles": articles,
+                "articlesByDate": codes(self.articlesByDate),
+                "articlesByMedium": codes(self.articlesByMedium),
+                "earliestDate": self.earliestDate,
+                "latestDate": self.latestDate,
+                "df": self.df,
+                "dfByMedium": self.dfByMedium,
+                "deduplicator": self.deduplicator,
+                "clusterIds": getattr(self, "clusterIds", None),
+                "duplicates": getattr(self, "duplicates", None),
+                "droppedDuplicates": getattr(self, "droppedDuplicates", 0),
+                "errors": self.errors}
+
+    def _restore_state(self, state):
+        articles = state["articles"]
+        dateKeys, dateCodes = state["articlesByDate"]
+        mediumKeys, mediumCodes = state["articlesByMedium"]
+        if isinstance(articles, LexisNexisArticleStore):
+            self.articles = articles if self.compact is True else \
+                            list(articles)
+            objects = self.articles if self.compact is False else \
+                      list(articles)
+        # Views on the store either way, compact splitters hold the store
+        # itself.
+
+        else:
+            index = LexisNexisArticleIndex._restore(self.corpusPath, \
+                        self.BOM, self.profile, [articles["starts"], \
+                        articles["ends"], articles["mediumLines"], \
+                        articles["dateLines"]])
+            numbers = articles["numbers"]
+            if numbers is None:
+                numbers = range(len(index))
+            objects = [LexisNexisLazyArticle(index, number) for number in \
+                       numbers]
+            for article, dateCode, mediumCode in zip(objects, \
+                    dateCodes.tolist(), mediumCodes.tolist()):
+                if dateCode != -1:
+                    article._date = dateKeys[dateCode]
+                if mediumCode != -1:
+                    article._medium = mediumKeys[mediumCode]
+            self.articles = index if articles["numbers"] is None else objects
+        # Our groupings already know every article's date and medium, so
+        # nothing has to be decoded from the corpus again.
+
+        self.articlesByDate = self._restore_groups(objects, dateKeys, \
+                                                   dateCodes)
+        self.articlesByMedium = self._restore_groups(objects, mediumKeys, \
+                                                     mediumCodes)
+        self.earliestDate = state["earliestDate"]
+        self.latestDate = state["latestDate"]
+        self.df = state["df"]
+        self.dfByMedium = state["dfByMedium"]
+        self.deduplicator = state["deduplicator"]
+        self.clusterIds = state["clusterIds"]
+        self.duplicates = state["duplicates"]
+        self.droppedDuplicates = state["droppedDuplicates"]
+        self.errors = state["errors"]
+        self._resample_frequencies()
+
+    def _restore_groups(self, objects, keys, codes):
+        order = np.argsort(codes, kind="stable")
+        bounds = np.cumsum(np.bincount(codes + 1, minlength=len(keys) + 1))
+        groups = {}
+        for code, key in enumerate(keys):
+            groups[key] = [objects[i] for i in \
+                           order[bounds[code]:bounds[code + 1]].tolist()]
+        return groups
+        # A stable sort keeps every group in the order of our articles, the
+        # ungrouped articles (-1) come first and are skipped.
+
+    @_profiled("save", articles=lambda self, result: result.written, \
+               bytes=lambda self, result: result.bytesWritten)
+    def _save_articles(self, mode="byNumber", path=None, docSeparator=None, \
+                       articles=None, container="files", threads=8):
         if path == None:
             raise ValueError("Path is not set!")
         else:
             self.docSeparator = docSeparator + "\n"
-            currentDir = os.getcwd()
-            os.chdir(path)
-            newDir = str(mode) + "_" + datetime.now().strftime("%Y%m%d%H%M%S")
-            os.mkdir(newDir)
-            os.chdir(newDir)
-            if mode == "byNumber":
-                length = len(self.articles)
-                for i in range(0, length):
+            newDir = os.path.join(os.path.abspath(path), str(mode) + "_" + \
+                                  datetime.now().strftime("%Y%m%d%H%M%S"))
+            writer = LexisNexisWriter(newDir, container, threads, \
+                                      progress=self.progress)
+            # Everything is written by absolute path, so we never have to
+            # change our working directory.
+
+            try:
+                if articles is not None:
+                    self._save_article_stream(mode, writer, articles)
+                # Articles handed in directly (e.g. from _iter_articles())
+                # are written as they arrive instead of from our groupings.
+
+                else:
+                    groups = self._group_for_saving(mode)
+                    writer._make_dirs(groups.keys())
+                    for group, groupArticles in groups.items():
+                        length = len(groupArticles)
+                        for i, article in enumerate(groupArticles):
+                            fileName = str(i).zfill(len(str(length))) + ".txt"
+                            writer._write(group, fileName, \
+                                    self._format_article(mode, article), article)
+            finally:
+                writer._close()
+            return writer
+            # Hand back our writer, it knows how much we've written.
+
+    @_profiled("export", articles=lambda self, result: len(result), \
+               bytes=lambda self, result: len(result.texts))
+    def _export_articles(self, path, articles=None):
+        if articles is None and isinstance(self.articles, \
+                                           LexisNexisArticleStore):
+            store = self.articles
+        else:
+            store = LexisNexisArticleStore()
+            store.extend(self.articles if articles is None else articles)
+        columns = {}
+        if articles is None and getattr(self, "clusterIds", None) is not None:
+            columns["cluster"] = np.frombuffer(self.clusterIds, np.int64)
+            columns["duplicate"] = np.frombuffer(self.duplicates, np.int8) \
+                                   .astype(bool)
+        # Our clusters only line up with all of our articles.
+
+        store._write(path, columns)
+        return store
+        # Write all our articles into a single Parquet (.parquet) or Arrow
+        # (.arrow, .feather) file, which is read back far faster than a tree
+        # of single files.
+
+    def _export_groups(self, path, articles=None):
+        if articles is None:
+            byDate = {self._date_group(date): len(group) for date, group in \
+                      self.articlesByDate.items()}
+            byMedium = {medium: len(group) for medium, group in \
+                        self.articlesByMedium.items()}
+        else:
+            byDate = {}
+            byMedium = {}
+            for article in articles:
+                date = self._date_group(article.date)
+                byDate[date] = byDate.get(date, 0) + 1
+                byMedium[article.medium] = byMedium.get(article.medium, 0) + 1
+        # Count our own groups, or the articles we're handed (e.g. a query)
+        # without regrouping, which would replace our groups.
+
+        groups = {"byDate": dict(sorted(byDate.items())), \
+                  "byMedium": dict(sorted(byMedium.items()))}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(groups, f, ensure_ascii=False, indent=2)
+        return groups
+        # The number of articles per date and per medium as JSON, articles
+        # without a date are counted as "unknown".
+
+    def _export_frequency(self, path, freq="D", articles=None):
+        if articles is not None:
+            self._prepare_frequency_plotting(articles)
+        total = self.df if freq == "D" else self.df.resample(freq).sum()
+        table = pd.concat([total, self._frequency_by_medium(freq=freq)], \
+                          axis=1)
+        table.index.name = "date"
+        table.to_csv(path)
+        return table
+        # One row per day, week ("W") or month ("MS") with the number of all
+        # articles and one column per medium, as plotted by the GUI.
+
+    def _group_for_saving(self, mode):
+        if mode == "byNumber":
+            return {"": self._counted_articles()}
+        elif mode == "byDate":
+            return {self._date_group(date): articles for date, articles \
+                    in self.articlesByDate.items()}
+        elif mode == "byMedium":
+            groups = {}
+            for medium, articles in self.articlesByMedium.items():
+                groups.setdefault(self._sanitize_name(medium), []) \
+                      .extend(articles)
+            # Media that only differ in non-alphabetic characters end up in
+            # the same directory.
+
+            return groups
+        else:
+            raise ValueError("Unknown mode: " + str(mode))
+
+    def _format_article(self, mode, article):
+        # Build the whole file in memory so it's written in one go. Articles
+        # saved by date don't get the BOM and separator.
+        if mode == "byDate":
+            return "\n".join(article.text)
+        return self.BOM + "\n" + self.docSeparator + "\n".join(article.text)
+
+    def _sanitize_name(self, medium):
+        saneName = ""
+        for s in str(medium):
+            if s.isalpha():
+                saneName += s
+        if len(saneName) == 0:
+            raise ValueError(str(medium) + "does not contain any alphabetic letters?")
+        # Sanitize the name of our medium by just allowing letters from the
+        # alphabet.
+
+        return saneName
+
+    def _date_group(self, date):
+        if date is None:
+            return "unknown"
+        return date
+        # Articles without a date are saved to a directory of their own.
+
+    def _group_name(self, mode, article):
+        if mode == "byNumber":
+            return ""
+        elif mode == "byDate":
+            return self._date_group(article.date)
+        elif mode == "byMedium":
+            return self._sanitize_name(article.medium)
+        else:
+            raise ValueError("Unknown mode: " + str(mode))
+
+    def _save_article_stream(self, mode, writer, articles):
+        lengths = {}
+        for article in articles:
+            group = self._group_name(mode, article)
+            if group not in lengths:
+                lengths[group] = 0
+                writer._make_dirs([group])
+            # Create a directory for every date or medium the first time we
+            # come across it.
+
+            writer._write(group, str(lengths[group]) + ".txt", \
+                          self._format_article(mode, article), article)
+            lengths[group] += 1
+        writer._pad_names(lengths)
+        # We can't know how many articles a stream holds before it's used up,
+        # so number the files plainly first and pad the numbers afterwards to
+        # end up with the same names as when saving from our groupings.
+
+    @_profiled("save", articles=lambda self, result: result.written, \
+               bytes=lambda self, result: result.bytesWritten)
+    def _save_new_articles(self, mode="byNumber", path=None, \
+                           docSeparator=None, articles=None, \
+                           container="files", threads=8):
+        if path == None:
+            raise ValueError("Path is not set!")
+        self.docSeparator = docSeparator + "\n"
+        groups = {}
+        for article in articles:
+            groups.setdefault(self._group_name(mode, article), []) \
+                  .append(article)
+        writer = LexisNexisWriter(os.path.abspath(path), container, threads, \
+                                  append=True, progress=self.progress)
+        try:
+            writer._make_dirs(groups.keys())
+            for group, groupArticles in groups.items():
+                existing = writer._count(group)
+                length = existing + len(groupArticles)
+                writer._widen_names(group, existing, length)
+                for i, article in enumerate(groupArticles, existing):
                     fileName = str(i).zfill(len(str(length))) + ".txt"
-                    with open(fileName, "w") as f:
-                        f.write(self.BOM + "\n")
-                        f.write(self.docSeparator)
-                        f.write("\n".join(self.articles[i].text))
-                        
-            elif mode == "byDate":
-                for date in self.articlesByDate.keys():
-                    length = len(self.articlesByDate[date])
-                    os.mkdir(date)
-                    os.chdir(date)
-                    for i in range(0, length):
-                        fileName = str(i).zfill(len(str(length))) + ".txt"
-                        with open(fileName, "w") as f:
-#                            f.write(self.BOM + "\n")
-#                            f.write(self.docSeparator)
-                            f.write("\n".join \
-                                    (self.articlesByDate[date][i].text))
-                    os.chdir("..")
-                    
-            elif mode == "byMedium":
-                for medium in self.articlesByMedium.keys():
-                    saneName = ""
-                    for s in str(medium):
-                        if s.isalpha():
-                            saneName += s
-                    if len(saneName) == 0:
-                        raise ValueError(str(medium) + "does not contain any alphabetic letters?")
-                    # Sanitize the name of our medium by just allowing letters
-                    # from the alphabet.
-                    
-                    length = len(self.articlesByMedium[medium])
-                    os.mkdir(saneName)
-                    os.chdir(saneName)
-                    for i in range(0, length):
-                        fileName = str(i).zfill(len(str(length))) + ".txt"
-                        with open(fileName, "w") as f:
-                            f.write(self.BOM + "\n")
-                            f.write(self.docSeparator)
-                            f.write("\n".join(self.articlesByMedium[medium][i]\
-                                              .text))
-                    os.chdir("..")                    
-            os.chdir(currentDir)
-            
+                    writer._write(group, fileName, \
+                                  self._format_article(mode, article), article)
+        finally:
+            writer._close()
+        return writer
+        # Add articles (e.g. the ones _update_corpus() found) to a tree an
+        # earlier _save_articles() created at path, numbering them after the
+        # files every date or medium already holds.
+
+class LexisNexisBatchSplitter(LexisNexisSplitter):
+    def __init__(self, regex, corpora, months, workers=1, profiler=None, \
+                 compact=False, dedup=None, profile=None):
+        self.corpusPaths = _expand_corpora(corpora)
+        super(LexisNexisBatchSplitter, self).__init__(regex, \
+                self.corpusPaths[0], months, stream=True, workers=workers, \
+                profiler=profiler, compact=compact, dedup=dedup, \
+                profile=profile)
+        # Every file is streamed on its own, the first one just provides
+        # our BOM.
+
+    def _corpus_size(self):
+        return sum(os.path.getsize(path) for path in self.corpusPaths)
+
+    @_profiled("split", articles=lambda self, result: len(self.articles), \
+               bytes=lambda self, result: self._corpus_size())
+    def _split_corpus(self):
+        for article in self._collect_articles(self._iter_articles()):
+            pass
+        self._report("split", len(self.articles), force=True)
+
+    def _iter_articles(self):
+        if self.workers == 1:
+            for path in self.corpusPaths:
+                for article in _iter_source(path, self._source_profile(), \
+                                            self.profiler):
+                    yield article
+            return
+        # Without additional workers stream one file after the other.
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for path in self.corpusPaths:
+                pending.append(executor.submit(_parse_source, \
+                    (path, self._source_profile(), self._worker_profiler())))
+                if len(pending) > self.workers * 2:
+                    for article in self._source_articles(pending.popleft()):
+                        yield article
+            while len(pending) > 0:
+                for article in self._source_articles(pending.popleft()):
+                    yield article
+        # Parse whole files in our worker processes, but never more than
+        # twice as many as we have workers ahead of the consumer, so the
+        # memory we need depends on the size of the files and not on how
+        # many there are. Files are handed on in the order they were given.
+
+    def _source_articles(self, future):
+        articles, profiler = future.result()
+        self._merge_profiler(profiler)
+        return articles
+
+    def _source_profile(self):
+        if self.autoDetect is True:
+            return "auto"
+        return self.profile
+        # When detecting, every file gets the profile that fits it best, so
+        # batches can mix exports in different languages.
+
+    def _timed_split(self, articles):
+        record = self.profiler._record("split")
+        nextArticle = functools.partial(next, articles, None)
+        if self.profiler.hookStage == "split":
+            nextArticle = self.profiler._hooked("split", nextArticle)
+        seconds = 0.0
+        while True:
+            start = time.perf_counter()
+            article = nextArticle()
+            seconds += time.perf_counter() - start
+            if article is None:
+                break
+            yield article
+        record["seconds"] += seconds
+        record["calls"] += 1
+        record["articles"] += len(self.articles)
+        record["bytes"] += self._corpus_size()
+        # Only the time spent getting the next article counts as splitting,
+        # not what we do with it in between, e.g. saving it.
+
+    def _collect_articles(self, articles):
+        self.articles = self._new_articles()
+        if self.deduplicator is not None:
+            self._start_deduplication()
+            articles = self._deduplicate(articles)
+        # Duplicates are dropped before they're collected, or saved.
+
+        for article in articles:
+            self.articles.append(article)
+            self._report("split", len(self.articles))
+            yield article
+
+    def _process_corpus(self, cache=None, mode=None, path=None, \
+                        docSeparator=None, container="files"):
+        if cache is not None:
+            with self._stage("cache_load"):
+                key = cache._key(self)
+                state = cache._load(key)
+            if state is not None:
+                self._restore_state(state)
+                self._report("split", len(self.articles), force=True)
+                if mode is not None:
+                    self._save_articles(mode, path, docSeparator, \
+                                        container=container)
+                return
+
+        articles = self._collect_articles(self._iter_articles())
+        if self.profiler is not None:
+            articles = self._timed_split(articles)
+        if self.dedup == "collapse":
+            articles = (article for article in articles if \
+                        not self.duplicates[-1])
+        # The flag of the article just collected is always our last one.
+
+        if mode is not None:
+            self._save_articles(mode, path, docSeparator, articles=articles, \
+                                container=container)
+        else:
+            for article in articles:
+                pass
+        # Write the articles as soon as they are parsed instead of waiting
+        # for all files to be done.
+
+        self._report("split", len(self.articles), force=True)
+        self._group_and_count()
+        if cache is not None:
+            with self._stage("cache_store"):
+                cache._store(key, self._dump_state())
+
+class LexisNexisWriter():
+    containers = ["files", "tar", "zip", "jsonl"]
+
+    def __init__(self, targetDir, container="files", threads=8, append=False, \
+                 progress=None):
+        super(LexisNexisWriter, self).__init__()
+        self.progress = progress
+        self.written = 0
+        self.bytesWritten = 0
+        if container not in self.containers:
+            raise ValueError("Unknown container: " + str(container))
+        if append is True and container not in ["files", "jsonl"]:
+            raise ValueError("Can't add articles to a " + container + \
+                             " archive")
+        self.targetDir = targetDir
+        self.container = container
+        self.append = append
+        self.fingerprints = bytearray()
+        self.encoding = locale.getpreferredencoding(False)
+        self.pending = deque()
+        self.executor = None
+        self.archive = None
+        self.shards = OrderedDict()
+        if container == "files" or container == "jsonl":
+            os.makedirs(targetDir, exist_ok=append)
+        else:
+            os.makedirs(os.path.dirname(targetDir), exist_ok=True)
+        # Archives go next to where the directory would be, which might not
+        # exist yet either (e.g. every job of a queue saves to its own).
+
+        if container == "files":
+            self.threads = max(1, threads)
+            self.executor = ThreadPoolExecutor(max_workers=self.threads)
+        elif container == "tar":
+            self.archive = tarfile.open(targetDir + ".tar", "w")
+        elif container == "zip":
+            self.archive = zipfile.ZipFile(targetDir + ".zip", "w", \
+                                           zipfile.ZIP_DEFLATED)
+        # Plain files are written by a pool of threads, which mostly helps
+        # on network filesystems where each file costs a round trip. Archives
+        # hold all articles in a single file, JSONL writes one shard with one
+        # line per article for every date or medium.
+
+    def _make_dirs(self, groups):
+        if self.container != "files":
+            return
+        paths = [os.path.join(self.targetDir, group) for group in groups \
+                 if group != ""]
+        for result in self.executor.map(lambda path: os.makedirs(path, \
+                                        exist_ok=self.append), paths):
+            pass
+        # Create all directories up front before writing into them.
+
+    def _count(self, group):
+        # How many articles a date or medium already holds.
+        if self.container == "files":
+            try:
+                return len([fileName for fileName in os.listdir( \
+                    os.path.join(self.targetDir, group)) \
+                    if fileName.endswith(".txt")])
+            except FileNotFoundError:
+                return 0
+        elif self.container == "jsonl":
+            fileName = (group if group != "" else "articles") + ".jsonl"
+            try:
+                with open(os.path.join(self.targetDir, fileName), "rb") as f:
+                    return f.read().count(b"\n")
+            except FileNotFoundError:
+                return 0
+
+    def _write(self, group, fileName, content, article):
+        if self.container in ["files", "jsonl"]:
+            self.fingerprints.extend(_fingerprint(article))
+        # Remember what we've written, so later runs can skip these articles.
+
+        self.written += 1
+        if self.progress is not None and self.written % 100 == 0:
+            self.progress("save", self.written)
+
+        if self.container == "files":
+            self.bytesWritten += len(content.encode(self.encoding))
+            self._wait(self.threads * 4)
+            self.pending.append(self.executor.submit(self._write_file, \
+                        os.path.join(self.targetDir, group, fileName), content))
+            # Don't let more than a few files per thread pile up in memory.
+
+        elif self.container == "tar":
+            data = content.encode(self.encoding)
+            info = tarfile.TarInfo(os.path.join(os.path.basename( \
+                                   self.targetDir), group, fileName))
+            info.size = len(data)
+            info.mtime = time.time()
+            self.archive.addfile(info, io.BytesIO(data))
+            self.bytesWritten += len(data)
+        elif self.container == "zip":
+            data = content.encode(self.encoding)
+            self.archive.writestr(os.path.join(os.path.basename( \
+                self.targetDir), group, fileName), data)
+            self.bytesWritten += len(data)
+        elif self.container == "jsonl":
+            record = {"file": fileName, "medium": article.medium, \
+                      "date": article.date, "text": "\n".join(article.text)}
+            if hasattr(article, "sourceFile"):
+                record["sourceFile"] = article.sourceFile
+                record["sourcePosition"] = article.sourcePosition
+            data = (json.dumps(record, ensure_ascii=False) + "\n") \
+                   .encode("utf-8")
+            self._shard(group).write(data)
+            self.bytesWritten += len(data)
+        # bytesWritten counts what ends up on disk, encoded, not characters.
+
+    def _write_file(self, path, content):
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _shard(self, group):
+        # Keep the most recently used shards open, a stream switches between
+        # dates or media all the time.
+        if group in self.shards:
+            self.shards.move_to_end(group)
+            return self.shards[group]
+        if len(self.shards) >= 64:
+            self.shards.popitem(last=False)[1].close()
+        fileName = (group if group != "" else "articles") + ".jsonl"
+        self.shards[group] = open(os.path.join(self.targetDir, fileName), \
+                                  "ab")
+        return self.shards[group]
+
+    def _wait(self, limit=0):
+        while len(self.pending) > limit:
+            self.pending.popleft().result()
+        # .result() raises any exception a thread ran into.
+
+    def _pad_names(self, lengths):
+        if self.container != "files":
+            return
+        self._wait()
+        for group, length in lengths.items():
+            groupDir = os.path.join(self.targetDir, group)
+            for i in range(0, length):
+                fileName = str(i).zfill(len(str(length))) + ".txt"
+                if fileName != str(i) + ".txt":
+                    os.rename(os.path.join(groupDir, str(i) + ".txt"), \
+                              os.path.join(groupDir, fileName))
+        # Entries of archives and shards can't be renamed, those keep their
+        # plain numbers.
+
+    def _widen_names(self, group, existing, length):
+        if self.container != "files" or len(str(existing)) == len(str(length)):
+            return
+        groupDir = os.path.join(self.targetDir, group)
+        for i in range(0, existing):
+            os.rename(os.path.join(groupDir, str(i).zfill(len(str(existing))) \
+                                   + ".txt"), \
+                      os.path.join(groupDir, str(i).zfill(len(str(length))) \
+                                   + ".txt"))
+        # Files are padded to the number of files in their directory, so
+        # once appending makes that number longer (e.g. from 9 to 11 files)
+        # the ones already there are renamed and all names still sort.
+
+    def _close(self):
+        if self.executor is not None:
+            try:
+                self._wait()
+            finally:
+                self.executor.shutdown()
+        if self.archive is not None:
+            self.archive.close()
+        for shard in self.shards.values():
+            shard.close()
+        if len(self.fingerprints) > 0:
+            with open(os.path.join(self.targetDir, ".fingerprints"), "ab") as f:
+                f.write(self.fingerprints)
+        if self.progress is not None:
+            self.progress("save", self.written)
+
+class LexisNexisArticleIndex():
+    def __init__(self, path, BOM, profile):
+        super(LexisNexisArticleIndex, self).__init__()
+        self.BOM = BOM
+        self.profile = profile
+        self.encoding = locale.getpreferredencoding(False)
+        # Decode with the same encoding codecs.open() uses when reading the
+        # corpus as text.
+
+        self.starts = array("q")
+        self.ends = array("q")
+        self.mediumLines = array("q")
+        self.dateLines = array("q")
+        # Byte offsets of each article's start & end and of the lines holding
+        # its medium & date. That's 32 bytes per article, no matter how long
+        # the article is.
+
+        self._map(path)
+        pattern = _encode_pattern(profile.boundary, self.encoding)
+        start = None
+        for match in pattern.finditer(self.corpus):
+            if start is not None:
+                self._add_article(start, match.start())
+            start = match.end()
+        if start is not None:
+            self._add_article(start, len(self.corpus))
+        # Just like _split_corpus() an article reaches from the end of one
+        # match to the start of the next one, everything before the first
+        # match is skipped.
+
+    @classmethod
+    def _restore(cls, path, BOM, profile, offsets):
+        index = cls.__new__(cls)
+        index.BOM = BOM
+        index.profile = profile
+        index.encoding = locale.getpreferredencoding(False)
+        index.starts, index.ends, index.mediumLines, index.dateLines = offsets
+        index._map(path)
+        return index
+        # Recreate an index from the offsets an earlier one found, e.g. when
+        # loading it from our cache, without searching the corpus again.
+
+    def _map(self, path):
+        self.file = open(path, "rb")
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.corpus = b""
+        else:
+            self.corpus = mmap.mmap(self.file.fileno(), 0, \
+                                    access=mmap.ACCESS_READ)
+        # Empty files can't be mapped, but they don't hold any articles
+        # either.
+
+    def _add_article(self, start, end):
+        metaLines = []
+        lineStart = start
+        while len(metaLines) < 2 and lineStart < end:
+            lineEnd = self.corpus.find(b"\n", lineStart, end)
+            if lineEnd == -1:
+                lineEnd = end
+            line = self.corpus[lineStart:lineEnd].decode(self.encoding)
+            if not (self.BOM in line or line.isspace() or line == ""):
+                metaLines.append(lineStart)
+            lineStart = lineEnd + 1
+        # The first two lines _clean_lines() would keep hold the medium
+        # and the date.
+
+        while len(metaLines) < 2:
+            metaLines.append(-1)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.mediumLines.append(metaLines[0])
+        self.dateLines.append(metaLines[1])
+
+    def _read_line(self, offset):
+        if offset == -1:
+            return ""
+        lineEnd = self.corpus.find(b"\n", offset)
+        if lineEnd == -1:
+            lineEnd = len(self.corpus)
+        return self.corpus[offset:lineEnd].decode(self.encoding).strip()
+
+    def _read_text(self, i):
+        article = self.corpus[self.starts[i]:self.ends[i]]
+        return _clean_lines(article.decode(self.encoding), self.BOM)
+
+    def _close(self):
+        if isinstance(self.corpus, mmap.mmap):
+            self.corpus.close()
+        self.file.close()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("article index out of range")
+        return LexisNexisLazyArticle(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield LexisNexisLazyArticle(self, i)
+
 class LexisNexisArticle():
-    def __init__(self, text, monthsConversionTable):
+    def __init__(self, text, profile):
         super(LexisNexisArticle, self).__init__()
         keepMetaData = False # Placeholder, make this an option in the GUI!
         if keepMetaData is True:
@@ -179,51 +1526,1150 @@ class LexisNexisArticle():
 
         self.medium = None
         self.date = None
-        while self.date == None:
-            for line in text:
-                if self.medium == None:
-                    self.medium = line.strip()
-                elif self.date == None:
-                    #try:
-                    self.date = self._format_date(line.strip(),\
-                                                      monthsConversionTable)
-                    #except Exception as e:
-                    #    print("\n\n\n" + str(self.text) + "\n" + \
-                    #    self.medium +"Exception" + str(e) + "encountered")
-                else:
-                    break
-                # Once we've set medium & date, exit.
-
-    def _format_date(self, date, monthsConversionTable):
-        dateList = date.split()
-        if dateList[0][0].isalpha() is True:
-            # If dateList starts with the day of the week the date sits in:
-            # [1:3].
-            day, month, year = dateList[1], dateList[2], dateList[3]
-        else:
-            # If dateList starts with a number the date sits in: [0:2].
-            day, month, year = dateList[0], dateList[1], dateList[2]
         try:
-            month = str(monthsConversionTable[month]).zfill(2)
-        except KeyError as e:
-            print("Encountered ", e, "while processing: ", date)
-        # Use the conversion table to get the right numeric representation of
-        # each month and .zfill to format all days to two digits.
-
-        day = re.search(re.compile("[0-9]{1,2}"), day).group().zfill(2)
-        year = re.search(re.compile("[0-9]{4}"), year).group()
-        # Sanitize day and year and ensure that days 1-9 have a leading zero.
-                            
-        date = "".join([year, month, day])
+            if len(text) < 2:
+                raise LexisNexisParseError("Article has no date line")
+            self.medium = text[0].strip()
+            self.date = profile._parse_date(text[1])
+        except LexisNexisParseError as e:
+            self.error = str(e)
+        # The first line holds the medium, the second the date. If there's
+        # no date we can read, remember why, our splitter reports it once the
+        # articles are grouped.
+
+    @classmethod
+    def _restore(cls, medium, date, text):
+        article = cls.__new__(cls)
+        article.medium = medium
+        article.date = date
+        article.text = text
+        # Recreate an article from its already parsed parts, e.g. when
+        # loading it from our cache.
+
+        return article
+
+class LexisNexisProfile():
+    def __init__(self, name, boundary, months, datePatterns=None, \
+                 abbreviations=None):
+        super(LexisNexisProfile, self).__init__()
+        self.name = name
+        self.boundary = re.compile(boundary)
+        self.months = months
+        if datePatterns is None:
+            datePatterns = [dayFirstDate]
+        self.datePatterns = [re.compile(pattern) for pattern in datePatterns]
+        self.monthsConversionTable = {}
+        for number, month in enumerate(months):
+            self.monthsConversionTable[month.casefold()] = number + 1
+        for month, number in (abbreviations or {}).items():
+            self.monthsConversionTable[month.casefold()] = number
+        # Everything is compiled once when the profile is created. Months are
+        # looked up regardless of their case, abbreviations map to the number
+        # of their month.
+
+        self.dates = {}
+        self.datesLock = threading.Lock()
+        # A corpus has far fewer distinct date lines than articles, so each
+        # one is only parsed once. Our profiles are shared by every splitter,
+        # also by the GUI's worker thread, so the memo only changes while we
+        # hold its lock.
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["dates"] = {}
+        del state["datesLock"]
+        return state
+        # Our worker processes and the cache get the profile without the
+        # dates we've memorized so far.
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.datesLock = threading.Lock()
+
+    def _settings(self):
+        return (self.name, self.boundary.pattern, [pattern.pattern for \
+                pattern in self.datePatterns], \
+                sorted(self.monthsConversionTable.items()))
+
+    def _parse_date(self, line):
+        date = self.dates.get(line, self)
+        if date is self:
+            date = self._match_date(line)
+            with self.datesLock:
+                if len(self.dates) >= 100000:
+                    self.dates = {}
+                self.dates[line] = date
+        if date is None:
+            raise LexisNexisParseError("No date found in: " + \
+                                       repr(line.strip()))
         return date
-    
-def main():
-    splitter = LexisNexisSplitter(regex, corpus, months)
-    splitter._split_corpus()
-#    splitter._group_articles_by_date()
-#    splitter._group_articles_by_medium()
-#    splitter._prepare_frequency_plotting()
+        # Each line is looked up only once, and a full memo is replaced
+        # instead of cleared, so another thread reading it at the same time
+        # never misses a date it has just found.
+
+    def _match_date(self, line):
+        for pattern in self.datePatterns:
+            match = pattern.search(line)
+            if match is None:
+                continue
+            month = self.monthsConversionTable.get( \
+                                            match.group("month").casefold())
+            day = int(match.group("day"))
+            if month is not None and 1 <= day <= 31:
+                return "%s%02d%02d" % (match.group("year"), month, day)
+        return None
+        # One search per pattern gives us day, month and year at once, the
+        # date comes back as YYYYMMDD.
+
+class LexisNexisErrorReport():
+    def __init__(self):
+        super(LexisNexisErrorReport, self).__init__()
+        self.errors = []
+
+    def _add(self, kind, message, article=None):
+        record = {"kind": kind, "message": message}
+        if article is not None:
+            record["medium"] = article.medium
+            if hasattr(article, "sourceFile"):
+                record["sourceFile"] = article.sourceFile
+                record["sourcePosition"] = article.sourcePosition
+            record["excerpt"] = " ".join(article.text)[:200]
+        self.errors.append(record)
+        # Enough to find the article again in its export.
+
+    def __len__(self):
+        return len(self.errors)
+
+    def _json(self):
+        return json.dumps(self.errors, indent=2, ensure_ascii=False)
+
+    def _write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self._json())
+
+class LexisNexisLazyArticle(LexisNexisArticle):
+    def __init__(self, index, number):
+        self.index = index
+        self.number = number
+        self._medium = None
+        self._date = None
+        # Don't call LexisNexisArticle.__init__(), nothing is decoded until
+        # one of the properties below is accessed.
+
+    @property
+    def text(self):
+        return self.index._read_text(self.number)[2:]
+
+    @property
+    def medium(self):
+        if self._medium is None:
+            self._medium = self.index._read_line( \
+                                    self.index.mediumLines[self.number])
+        return self._medium
+
+    @property
+    def date(self):
+        if self._date is None:
+            try:
+                self._date = self.index.profile._parse_date( \
+                    self.index._read_line(self.index.dateLines[self.number]))
+            except LexisNexisParseError as e:
+                self.error = str(e)
+        return self._date
+        # Medium and date are needed over and over again while grouping, so
+        # keep them once they are decoded.
+
+class LexisNexisArticleStore():
+    epoch = datetime(1970, 1, 1).toordinal()
+    noDate = -2**31
+
+    def __init__(self):
+        super(LexisNexisArticleStore, self).__init__()
+        self.days = array("i")
+        self.mediumIds = array("i")
+        self.media = []
+        self.mediumLookup = {}
+        self.texts = bytearray()
+        self.textOffsets = array("q", [0])
+        self.sourceIds = array("i")
+        self.sourcePositions = array("q")
+        self.sources = []
+        self.sourceLookup = {}
+        # Dates are stored as days since 1970-01-01, media and source files
+        # as numbers into a list of their distinct values and the text of all
+        # articles as one UTF-8 buffer, article i reaches from textOffsets[i]
+        # to textOffsets[i+1]. Apart from its text an article takes up 28
+        # bytes, no Python objects at all.
+
+        self.oddDates = {}
+        self.dateErrors = {}
+        self.dayNumbers = {}
+        self.dateStrings = {}
+        # Dates we couldn't make sense of are kept as they are, and there are
+        # far fewer distinct dates than articles, so each is converted once.
+
+    def _day_number(self, date, number):
+        if date not in self.dayNumbers:
+            try:
+                self.dayNumbers[date] = datetime.strptime(date, "%Y%m%d") \
+                                        .toordinal() - self.epoch
+            except (TypeError, ValueError):
+                self.dayNumbers[date] = None
+        if self.dayNumbers[date] is None:
+            self.oddDates[number] = date
+            return self.noDate
+        return self.dayNumbers[date]
+
+    def _date_string(self, number):
+        day = self.days[number]
+        if day == self.noDate:
+            return self.oddDates[number]
+        if day not in self.dateStrings:
+            self.dateStrings[day] = datetime.fromordinal(day + self.epoch) \
+                                    .strftime("%Y%m%d")
+        return self.dateStrings[day]
+
+    def _lookup(self, values, lookup, value):
+        if value not in lookup:
+            lookup[value] = len(values)
+            values.append(value)
+        return lookup[value]
+
+    def append(self, article):
+        number = len(self)
+        self.days.append(self._day_number(article.date, number))
+        if hasattr(article, "error"):
+            self.dateErrors[number] = article.error
+        self.mediumIds.append(self._lookup(self.media, self.mediumLookup, \
+                                           article.medium))
+        self.texts += "\n".join(article.text).encode("utf-8", \
+                                                     "surrogatepass")
+        self.textOffsets.append(len(self.texts))
+        if hasattr(article, "sourceFile"):
+            self.sourceIds.append(self._lookup(self.sources, \
+                                  self.sourceLookup, article.sourceFile))
+            self.sourcePositions.append(article.sourcePosition)
+        else:
+            self.sourceIds.append(-1)
+            self.sourcePositions.append(-1)
+        # Articles from a batch know which file they came from.
+
+    def extend(self, articles):
+        if isinstance(articles, LexisNexisArticleStore):
+            self._extend_store(articles)
+            return
+        for article in articles:
+            self.append(article)
+
+    def _extend_store(self, store):
+        number = len(self)
+        self.days.extend(store.days)
+        self.oddDates.update((number + i, date) for i, date in \
+                             store.oddDates.items())
+        self.dateErrors.update((number + i, error) for i, error in \
+                               store.dateErrors.items())
+        mediumIds = np.array([self._lookup(self.media, self.mediumLookup, \
+                     medium) for medium in store.media] + [-1], np.int32)
+        self.mediumIds.frombytes(mediumIds[np.frombuffer(store.mediumIds, \
+                                 np.int32)].tobytes())
+        offsets = np.frombuffer(store.textOffsets, np.int64)[1:]
+        self.textOffsets.frombytes((offsets + len(self.texts)).tobytes())
+        self.texts += store.texts
+        sourceIds = np.array([self._lookup(self.sources, self.sourceLookup, \
+                     source) for source in store.sources] + [-1], np.int32)
+        self.sourceIds.frombytes(sourceIds[np.frombuffer(store.sourceIds, \
+                                 np.int32)].tobytes())
+        self.sourcePositions.extend(store.sourcePositions)
+        # Append a whole store at once, only the numbers of media and source
+        # files have to be translated into ours (the -1 of articles without
+        # a source file stays -1, it picks the last entry).
+
+    def __len__(self):
+        return len(self.days)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("article index out of range")
+        return LexisNexisStoredArticle(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield LexisNexisStoredArticle(self, i)
+
+    def _to_arrow(self, extraColumns=None):
+        pa, pq = _import_arrow("Exporting")
+        days = np.frombuffer(self.days, dtype=np.int32)
+        text = pa.Array.from_buffers(pa.large_string(), len(self), \
+                    [None, pa.py_buffer(self.textOffsets), \
+                     pa.py_buffer(self.texts)])
+        columns = {"date": pa.array(days, type=pa.int32(), \
+                                    mask=days == self.noDate).cast(pa.date32()),
+                   "medium": pa.DictionaryArray.from_arrays( \
+                        pa.array(np.frombuffer(self.mediumIds, np.int32)), \
+                        pa.array(self.media, type=pa.string())),
+                   "text": text}
+        # Our columns already are what Arrow keeps in memory, so the text is
+        # handed over without copying it. The lines of an article are joined
+        # by newlines.
+
+        if len(self.sources) > 0:
+            sourceIds = np.frombuffer(self.sourceIds, dtype=np.int32)
+            columns["sourceFile"] = pa.DictionaryArray.from_arrays( \
+                pa.array(sourceIds, mask=sourceIds == -1), \
+                pa.array(self.sources, type=pa.string()))
+            columns["sourcePosition"] = pa.array(np.frombuffer( \
+                self.sourcePositions, dtype=np.int64))
+        if extraColumns is not None:
+            for name, values in extraColumns.items():
+                columns[name] = pa.array(values)
+        return pa.table(columns)
+        # Extra columns, e.g. duplicate clusters, need one value per article.
+
+    def _write(self, path, extraColumns=None):
+        pa, pq = _import_arrow("Exporting")
+        table = self._to_arrow(extraColumns)
+        if path.endswith(".parquet"):
+            pq.write_table(table, path)
+        else:
+            with pa.OSFile(path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        # Parquet for our analytics jobs, everything else (.arrow, .feather)
+        # becomes an Arrow IPC file that can be memory mapped as it is.
+
+    @classmethod
+    def _read(cls, path):
+        pa, pq = _import_arrow("Reading")
+        if path.endswith(".parquet"):
+            table = pq.read_table(path)
+        else:
+            with pa.memory_map(path, "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+        store = cls()
+        for day, medium, text in zip(table.column("date").to_pylist(), \
+                                     table.column("medium").to_pylist(), \
+                                     table.column("text").to_pylist()):
+            date = None if day is None else day.strftime("%Y%m%d")
+            store.append(LexisNexisArticle._restore(medium, date, \
+                                                    text.split("\n")))
+        return store
+        # Source files aren't restored, they only matter for the export.
+
+class LexisNexisStoredArticle():
+    __slots__ = ("store", "number")
+
+    def __init__(self, store, number):
+        self.store = store
+        self.number = number
+        # Just a view on one article of a LexisNexisArticleStore, it behaves
+        # like a LexisNexisArticle but holds nothing itself.
+
+    @property
+    def text(self):
+        start = self.store.textOffsets[self.number]
+        end = self.store.textOffsets[self.number + 1]
+        if start == end:
+            return []
+        return self.store.texts[start:end].decode("utf-8", \
+                                                  "surrogatepass").split("\n")
+
+    @property
+    def medium(self):
+        return self.store.media[self.store.mediumIds[self.number]]
+
+    @property
+    def date(self):
+        return self.store._date_string(self.number)
+
+    @property
+    def error(self):
+        if self.number not in self.store.dateErrors:
+            raise AttributeError("error")
+        return self.store.dateErrors[self.number]
+
+    @property
+    def sourceFile(self):
+        sourceId = self.store.sourceIds[self.number]
+        if sourceId == -1:
+            raise AttributeError("sourceFile")
+        return self.store.sources[sourceId]
+
+    @property
+    def sourcePosition(self):
+        if self.store.sourceIds[self.number] == -1:
+            raise AttributeError("sourcePosition")
+        return self.store.sourcePositions[self.number]
+
+class LexisNexisQueryIndex():
+    def __init__(self, articles):
+        super(LexisNexisQueryIndex, self).__init__()
+        self.articles = articles
+        dates = np.array([article.date or "" for article in articles], \
+                         dtype=str)
+        self.order = np.argsort(dates, kind="stable")
+        self.dates = dates[self.order]
+        # Article positions sorted by date, so every date range is a single
+        # slice we find with two binary searches. Articles without a date
+        # are sorted first as "", ahead of every YYYYMMDD.
+
+        codes, media = pd.factorize(pd.Series([article.medium for article \
+                                    in articles], dtype=object))
+        codes = codes[self.order]
+        byMedium = np.argsort(codes, kind="stable")
+        bounds = np.cumsum(np.bincount(codes, minlength=len(media)))[:-1]
+        self.media = dict(zip(media, zip(np.split(self.dates[byMedium], \
+                    bounds), np.split(self.order[byMedium], bounds))))
+        # The same once more for every medium on its own, so asking for a
+        # few media doesn't mean looking at the articles of all the others.
+        # Our articles already are in order of their date, so a stable sort
+        # by medium keeps every medium's articles sorted by date and one
+        # sort splits into all of them, however many media there are.
+
+    def __len__(self):
+        return len(self.order)
+
+    def _date_key(self, date):
+        if date is None or isinstance(date, str):
+            return date
+        return date.strftime("%Y%m%d")
+        # Dates are compared as the YYYYMMDD strings our articles use,
+        # datetime.date and datetime.datetime objects are converted.
+
+    def _positions(self, start=None, end=None, media=None):
+        start, end = self._date_key(start), self._date_key(end)
+        if media is None:
+            ranges = [(self.dates, self.order)]
+        else:
+            ranges = [self.media[medium] for medium in media \
+                      if medium in self.media]
+        found = []
+        for dates, positions in ranges:
+            if start is not None:
+                first = np.searchsorted(dates, start, "left")
+            elif end is not None:
+                first = np.searchsorted(dates, "", "right")
+            else:
+                first = 0
+            # Once a range is asked for, articles without a date are never
+            # part of it, not even when one of its ends is open.
+
+            last = len(dates) if end is None else np.searchsorted(dates, \
+                                                                 end, "right")
+            found.append(positions[first:last])
+        if len(found) == 0:
+            return np.array([], dtype=np.intp)
+        return np.sort(np.concatenate(found))
+        # Both ends of the range are included. Positions come back in the
+        # order of our articles, not sorted by date.
+
+    def _query(self, start=None, end=None, media=None):
+        return [self.articles[i] for i in self._positions(start, end, media)]
+        # Only references to our articles, nothing is copied.
+
+class LexisNexisDeduplicator():
+    def __init__(self, threshold=0.8, permutations=64, bands=8, \
+                 shingleSize=5, seed=1):
+        super(LexisNexisDeduplicator, self).__init__()
+        if permutations % bands != 0:
+            raise ValueError("permutations must be a multiple of bands")
+        self.threshold = threshold
+        self.permutations = permutations
+        self.bands = bands
+        self.rows = permutations // bands
+        self.shingleSize = shingleSize
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.multipliers = rng.integers(0, 2**64, size=(permutations, 1), \
+                                        dtype=np.uint64) | np.uint64(1)
+        self.increments = rng.integers(0, 2**64, size=(permutations, 1), \
+                                       dtype=np.uint64)
+        # One multiply-shift hash function per permutation. They're derived
+        # from seed, so signatures are the same in every process and run.
+
+        self._clear()
+
+    def _settings(self):
+        return (self.threshold, self.permutations, self.bands, \
+                self.shingleSize, self.seed)
+
+    def _clear(self):
+        self.exact = {}
+        self.buckets = [{} for band in range(self.bands)]
+        self.signatures = array("I")
+        self.clusters = 0
+        # Only the first article of every cluster gets a signature and
+        # buckets, duplicates just look them up. Memory grows with the number
+        # of distinct articles (about 1 kB each), not with the number of
+        # reprints. Signatures are stored back to back, permutations values
+        # per cluster.
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["exact"] = (b"".join(self.exact.keys()), \
+                          array("q", self.exact.values()))
+        state["buckets"] = [(np.fromiter(bucket.keys(), np.uint64, \
+                             len(bucket)), array("q", bucket.values())) \
+                            for bucket in self.buckets]
+        return state
+        # Pickle our lookups as flat arrays instead of dictionaries with an
+        # entry or several per article, e.g. for our cache.
+
+    def __setstate__(self, state):
+        digests, clusters = state["exact"]
+        state["exact"] = dict(zip([digests[i:i + 16] for i in \
+                              range(0, len(digests), 16)], clusters))
+        state["buckets"] = [dict(zip(keys.tolist(), clusters)) for keys, \
+                            clusters in state["buckets"]]
+        self.__dict__.update(state)
+
+    def _signature(self, text):
+        words = " ".join(text).lower().split()
+        if len(words) == 0:
+            return None
+        hashes = np.fromiter((zlib.crc32(word.encode("utf-8", \
+                    "surrogatepass")) for word in words), dtype=np.uint64, \
+                    count=len(words))
+        size = min(self.shingleSize, len(words))
+        shingles = np.zeros(len(words) - size + 1, dtype=np.uint64)
+        for i in range(size):
+            shingles = shingles * np.uint64(1000003) + \
+                       hashes[i:len(hashes) - size + 1 + i]
+        # Hash every word once and combine shingleSize neighbouring words
+        # into one shingle, articles shorter than that are a single shingle.
+
+        return ((self.multipliers * np.unique(shingles)[None, :] + \
+                 self.increments) >> np.uint64(32)).min(axis=1) \
+                 .astype(np.uint32)
+        # The MinHash signature: the smallest value every hash function
+        # takes over our shingles. Two articles agree on a row with a
+        # probability equal to the Jaccard similarity of their shingles.
+
+    def _band_keys(self, signature):
+        rows = signature.reshape(self.bands, self.rows).astype(np.uint64)
+        keys = np.zeros(self.bands, dtype=np.uint64)
+        for row in range(self.rows):
+            keys = keys * np.uint64(1000003) + rows[:, row]
+        return keys.tolist()
+
+    def _add(self, text):
+        digest = hashlib.blake2b("\n".join(text).encode("utf-8", \
+                                 "surrogatepass"), digest_size=16).digest()
+        if digest in self.exact:
+            return self.exact[digest], True
+        # Exact duplicates are found without looking at a single shingle.
+
+        signature = self._signature(text)
+        cluster = None
+        if signature is not None:
+            keys = self._band_keys(signature)
+            candidates = set(bucket[key] for bucket, key in \
+                             zip(self.buckets, keys) if key in bucket)
+            best = self.threshold
+            for candidate in candidates:
+                similarity = np.mean(signature == np.frombuffer( \
+                    self.signatures, dtype=np.uint32, count=self.permutations, \
+                    offset=candidate * self.permutations * 4))
+                if similarity >= best:
+                    cluster, best = candidate, similarity
+        # Articles that share all rows of at least one band with the first
+        # article of a cluster are candidates, they belong to it if enough
+        # of their whole signatures agree. That's a few dictionary lookups
+        # per article instead of a comparison with every other article.
+
+        duplicate = cluster is not None
+        if not duplicate:
+            cluster = self.clusters
+            self.clusters += 1
+            if signature is None:
+                self.signatures.extend([0] * self.permutations)
+            else:
+                self.signatures.frombytes(signature.tobytes())
+                for bucket, key in zip(self.buckets, keys):
+                    bucket.setdefault(key, cluster)
+        # Articles without any words are only ever exact duplicates, their
+        # signature is never looked at.
+        self.exact[digest] = cluster
+        return cluster, duplicate
+
+class LexisNexisProfiler():
+    tools = ["cprofile", "tracemalloc"]
+    knownStages = ["read", "split", "regex_split", "filter_lines", \
+                   "parse_metadata", "dedup", "group_by_date", \
+                   "group_by_medium", "query", "query_index", "frequency", \
+                   "update", "save", "export", "cache_load", "cache_store"]
+    # Every stage our splitters record, the ones a hook can be run around.
+
+    def __init__(self, hookStage=None, hookTool="cprofile"):
+        super(LexisNexisProfiler, self).__init__()
+        if hookTool not in self.tools:
+            raise ValueError("Unknown profiling tool: " + str(hookTool))
+        if hookStage is not None and hookStage not in self.knownStages:
+            raise ValueError("Unknown stage: " + str(hookStage))
+        self.hookStage = hookStage
+        self.hookTool = hookTool
+        self.stages = OrderedDict()
+        # Run cProfile or tracemalloc around hookStage only, both slow down
+        # everything they watch considerably.
+
+        self.hooks = {}
+        # Hooks of timed stages, they run around every call and are only
+        # stopped once we report.
+
+        self.peaks = []
+        # The highest resident set size seen so far by each stage that is
+        # running right now, outermost first.
+
+    def _record(self, stage):
+        if stage not in self.stages:
+            self.stages[stage] = {"stage": stage, "calls": 0, "seconds": 0.0, \
+                                  "articles": 0, "bytes": 0, "peakMemory": None}
+        return self.stages[stage]
+        # Stages that run more than once add up in the same record.
+
+    @contextlib.contextmanager
+    def _stage(self, stage):
+        record = self._record(stage)
+        self._fold_peak(self._high_water())
+        measured = self._reset_high_water()
+        self.peaks.append(0)
+        hook = self._start_hook() if stage == self.hookStage else None
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] += time.perf_counter() - start
+            record["calls"] += 1
+            peak = max(self.peaks.pop(), self._high_water() or 0)
+            self._fold_peak(peak)
+            if measured is True:
+                record["peakMemory"] = max(record["peakMemory"] or 0, peak)
+            if hook is not None:
+                self._stop_hook(hook, record)
+        # Every stage resets the high-water mark of our resident set size
+        # when it starts, so its peakMemory is its own peak and not the
+        # highest one of everything that ran before. Whatever a stage saw
+        # before an inner stage reset the mark is kept for it in self.peaks.
+
+    def _timed(self, stage, function):
+        record = self._record(stage)
+        if stage == self.hookStage:
+            function = self._hooked(stage, function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record["seconds"] += time.perf_counter() - start
+                record["calls"] += 1
+        return timed
+        # For steps that run once per article or line, e.g. filtering lines
+        # or formatting dates, inside a bigger stage.
+
+    def _hooked(self, stage, function):
+        def hooked(*args, **kwargs):
+            if stage not in self.hooks:
+                self.hooks[stage] = [self._start_hook(), 0]
+            hook = self.hooks[stage]
+            if self.hookTool == "cprofile":
+                hook[0].enable()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    hook[0].disable()
+            tracemalloc.reset_peak()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                hook[1] = max(hook[1], tracemalloc.get_traced_memory()[1])
+        return hooked
+        # cProfile only watches the calls themselves and adds them all up,
+        # tracemalloc keeps tracing in between but its peak is the highest
+        # one of a single call.
+
+    def _stop_hooks(self):
+        for stage, (hook, peak) in self.hooks.items():
+            self._stop_hook(hook, self.stages[stage], peak)
+        self.hooks.clear()
+
+    def _fold_peak(self, peak):
+        if peak is None:
+            return
+        for i in range(len(self.peaks)):
+            self.peaks[i] = max(self.peaks[i], peak)
+
+    def _high_water(self):
+        try:
+            with open("/proc/self/status") as f:
+                match = re.search(r"VmHWM:\s+(\d+)\s+kB", f.read())
+        except OSError:
+            return None
+        if match is None:
+            return None
+        return int(match.group(1)) * 1024
+        # Our highest resident set size since the last reset, in bytes.
+
+    def _reset_high_water(self):
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            return False
+        return True
+        # Only Linux lets us reset the mark, elsewhere there's no peak of a
+        # single stage and its peakMemory stays None.
+
+    def _peak_memory(self):
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != "darwin":
+            peak *= 1024
+        return peak
+        # The largest resident set size our process had so far, in bytes
+        # (Linux reports it in kilobytes, macOS in bytes).
+
+    def _start_hook(self):
+        if self.hookTool == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+            return profile
+        startedTracing = not tracemalloc.is_tracing()
+        if startedTracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        return startedTracing
+
+    def _stop_hook(self, hook, record, peak=None):
+        if self.hookTool == "cprofile":
+            hook.disable()
+            stream = io.StringIO()
+            pstats.Stats(hook, stream=stream).sort_stats("cumulative") \
+                  .print_stats(25)
+            record["cProfile"] = stream.getvalue()
+        else:
+            if peak is None:
+                peak = tracemalloc.get_traced_memory()[1]
+            record["tracemallocPeak"] = peak
+            record["tracemallocTop"] = [str(statistic) for statistic in \
+                tracemalloc.take_snapshot().statistics("lineno")[:10]]
+            if hook is True:
+                tracemalloc.stop()
+
+    def _report(self):
+        self._stop_hooks()
+        stages = []
+        for record in self.stages.values():
+            record = dict(record)
+            if record["seconds"] > 0:
+                record["articlesPerSecond"] = record["articles"] / \
+                                              record["seconds"]
+                record["bytesPerSecond"] = record["bytes"] / record["seconds"]
+            stages.append(record)
+        return {"stages": stages, "peakMemory": self._peak_memory()}
+        # regex_split, filter_lines and parse_metadata are part of split, so
+        # their seconds are counted twice when adding everything up. The
+        # same goes for a batch split while saving, which is part of save.
+
+    def _merge(self, profiler):
+        for stage, theirs in profiler.stages.items():
+            record = self._record(stage)
+            for key in ["calls", "seconds", "articles", "bytes"]:
+                record[key] += theirs[key]
+            for key in ["cProfile", "tracemallocPeak", "tracemallocTop"]:
+                if key in theirs and key not in record:
+                    record[key] = theirs[key]
+        # Add up what a worker process has recorded, so the seconds of its
+        # stages are the time all workers spent on them together. Only the
+        # first worker's hook output is kept.
+
+    def _json(self):
+        return json.dumps(self._report(), indent=2)
+
+class LexisNexisCache():
+    version = 7
+    # Bump this whenever the layout of the cached state changes.
+
+    def __init__(self, cacheDir=None, maxSize=2 * 1024**3):
+        super(LexisNexisCache, self).__init__()
+        if cacheDir is None:
+            cacheDir = os.path.join(os.path.expanduser("~"), ".cache", \
+                                    "NexisSplit")
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+        os.makedirs(self.cacheDir, exist_ok=True)
+        self.hashesPath = os.path.join(self.cacheDir, "hashes.json")
+        try:
+            with open(self.hashesPath, "r") as f:
+                self.hashes = json.load(f)
+        except (OSError, ValueError):
+            self.hashes = {}
+        # Remember the content hash of every corpus file we've seen together
+        # with its size and modification time, so an unchanged file doesn't
+        # have to be read again just to find out it hasn't changed.
+
+    def _hash_file(self, path):
+        stat = os.stat(path)
+        statKey = "|".join([os.path.abspath(path), str(stat.st_size), \
+                            str(stat.st_mtime_ns)])
+        if statKey in self.hashes:
+            return self.hashes[statKey]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024**2), b""):
+                digest.update(chunk)
+        self.hashes[statKey] = digest.hexdigest()
+        with open(self.hashesPath + ".tmp", "w") as f:
+            json.dump(self.hashes, f)
+        os.replace(self.hashesPath + ".tmp", self.hashesPath)
+        return self.hashes[statKey]
+
+    def _key(self, splitter):
+        digest = hashlib.sha256()
+        digest.update(str(self.version).encode("utf-8"))
+        if isinstance(splitter, LexisNexisBatchSplitter):
+            for path in splitter.corpusPaths:
+                digest.update(self._hash_file(path).encode("utf-8"))
+        elif splitter.corpusPath is not None:
+            digest.update(self._hash_file(splitter.corpusPath).encode("utf-8"))
+        else:
+            for line in splitter.corpus:
+                digest.update(line.encode("utf-8", "surrogatepass"))
+        digest.update(b"\0" + repr((splitter.autoDetect, \
+                splitter.profile._settings(), splitter.index is True and \
+                splitter.corpus is None)).encode("utf-8"))
+        if splitter.deduplicator is not None:
+            digest.update(b"\0" + repr((splitter.dedup, \
+                splitter.deduplicator._settings())).encode("utf-8"))
+        # The key changes as soon as the corpus, our regex or the months do,
+        # or whether an index is cached, so stale entries are never loaded
+        # and simply age out of the cache. A file we read into a list is
+        # known by the hash of the file, which is only computed once. Compact
+        # and other splitters share entries, the articles are restored as
+        # whatever the splitter keeps.
+
+        return digest.hexdigest()
+
+    def _load(self, key):
+        path = os.path.join(self.cacheDir, key + ".cache")
+        try:
+            with open(path, "rb") as f:
+                state = pickle.loads(zlib.decompress(f.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            return None
+        os.utime(path)
+        # Touch the file on every hit, its modification time is what our LRU
+        # eviction goes by.
+
+        return state
+
+    def _store(self, key, state):
+        path = os.path.join(self.cacheDir, key + ".cache")
+        with open(path + ".tmp", "wb") as f:
+            f.write(zlib.compress(pickle.dumps(state, \
+                                       pickle.HIGHEST_PROTOCOL), 1))
+        os.replace(path + ".tmp", path)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for fileName in os.listdir(self.cacheDir):
+            if fileName.endswith(".cache"):
+                stat = os.stat(os.path.join(self.cacheDir, fileName))
+                entries.append((stat.st_mtime, stat.st_size, fileName))
+        entries.sort()
+        size = sum(entry[1] for entry in entries)
+        while size > self.maxSize and len(entries) > 1:
+            mtime, entrySize, fileName = entries.pop(0)
+            os.remove(os.path.join(self.cacheDir, fileName))
+            size -= entrySize
+        # Drop the least recently used entries until we're below our size
+        # limit again, but always keep the newest one.
+
+profiles = OrderedDict([
+    ("de", LexisNexisProfile("de", regex, months, [dayFirstDate], \
+        {"Jan": 1, "Jänner": 1, "Feb": 2, "Mär": 3, "Maerz": 3, "Apr": 4, \
+         "Jun": 6, "Jul": 7, "Aug": 8, "Sep": 9, "Sept": 9, "Okt": 10, \
+         "Nov": 11, "Dez": 12})),
+    ("en", LexisNexisProfile("en", r"(?:\d{1,4}\ of\ \d{1,4}\ DOCUMENTS?|" \
+        r"Document\ \d{1,4}\ of\ \d{1,4})", ["January", "February", "March", \
+        "April", "May", "June", "July", "August", "September", "October", \
+        "November", "December"], [monthFirstDate, dayFirstDate], \
+        {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "Jun": 6, "Jul": 7, \
+         "Aug": 8, "Sep": 9, "Sept": 9, "Oct": 10, "Nov": 11, "Dec": 12})),
+    ("fr", LexisNexisProfile("fr", r"(?:Document|DOCUMENT)\ \d{1,4}\ " \
+        r"(?:de|sur)\ \d{1,4}", ["janvier", "février", "mars", "avril", \
+        "mai", "juin", "juillet", "août", "septembre", "octobre", \
+        "novembre", "décembre"], [dayFirstDate], \
+        {"janv": 1, "fevrier": 2, "févr": 2, "fevr": 2, "avr": 4, \
+         "juil": 7, "aout": 8, "sept": 9, "oct": 10, "nov": 11, \
+         "decembre": 12, "déc": 12, "dec": 12}))])
+detectionPattern = None
+# The exports LexisNexis produces in German, English and French. The German
+# boundary is our regex from above, so German corpora split just like they
+# always have.
+
+periods = OrderedDict([("day", "D"), ("week", "W"), ("month", "MS")])
+# What --frequency counts by, weeks end on Sundays and months are labelled
+# with their first day just like in _resample_frequencies().
+
+def _parser():
+    parser = argparse.ArgumentParser(description="Split a LexisNexis export " \
+                                     "into single articles.")
+    parser.add_argument("corpus", nargs="*", default=[corpus], \
+                        help="paths, directories or glob patterns of the " \
+                        "exports (default: %(default)s)")
+    parser.add_argument("-w", "--workers", type=int, default=1, \
+                        help="number of processes to parse articles with, " \
+                        "0 uses one per core (default: %(default)s)")
+    parser.add_argument("-p", "--parser", default="auto", \
+                        choices=["auto"] + list(profiles), \
+                        help="language of the exports, auto detects it for " \
+                        "every file (default: %(default)s)")
+    parser.add_argument("--errors", metavar="FILE", \
+                        help="write articles with malformed headers to this " \
+                        "JSON file")
+    parser.add_argument("-s", "--save", \
+                        choices=["byNumber", "byDate", "byMedium"], \
+                        help="save the articles in this mode")
+    parser.add_argument("-o", "--output", default=os.getcwd(), \
+                        help="directory to save the articles to " \
+                        "(default: the current directory)")
+    parser.add_argument("-c", "--container", default="files", \
+                        choices=LexisNexisWriter.containers, \
+                        help="write single files, one tar or zip archive " \
+                        "or one JSONL shard per group (default: %(default)s)")
+    parser.add_argument("-u", "--update", metavar="TREE", \
+                        help="only add articles that aren't in TREE yet, a " \
+                        "directory an earlier --save created")
+    parser.add_argument("--separator", default="Dokument 999 von 999", \
+                        help="line written on top of every saved article " \
+                        "(default: %(default)s)")
+    parser.add_argument("--compact", action="store_true", \
+                        help="keep the articles in a compact columnar store " \
+                        "instead of one object each")
+    parser.add_argument("-e", "--export", metavar="FILE", \
+                        help="also write all articles to a Parquet " \
+                        "(.parquet) or Arrow (.arrow, .feather) file")
+    parser.add_argument("--from", dest="start", metavar="YYYYMMDD", \
+                        help="only save or export articles from this date on")
+    parser.add_argument("--to", dest="end", metavar="YYYYMMDD", \
+                        help="only save or export articles up to this date")
+    parser.add_argument("-m", "--medium", action="append", \
+                        help="only save or export articles of this medium, " \
+                        "can be given several times")
+    parser.add_argument("-d", "--dedup", choices=["flag", "collapse", \
+                        "drop"], help="find exact and near duplicates, flag " \
+                        "them (in the cluster column of --export), also " \
+                        "save, group and count only one article per " \
+                        "cluster (collapse) or drop them")
+    parser.add_argument("--dedup-threshold", type=float, default=0.8, \
+                        help="estimated similarity from which on articles " \
+                        "are near duplicates (default: %(default)s)")
+    parser.add_argument("-g", "--groups", metavar="FILE", \
+                        help="write the number of articles per date and per " \
+                        "medium to this JSON file")
+    parser.add_argument("-f", "--frequency", metavar="FILE", \
+                        help="write the number of articles per day, week or " \
+                        "month, in all and per medium, to this CSV file")
+    parser.add_argument("--period", default="day", choices=list(periods), \
+                        help="period --frequency counts articles by " \
+                        "(default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, \
+                        help="number of jobs to run at once with --each or " \
+                        "--manifest, 0 runs one per core " \
+                        "(default: %(default)s)")
+    parser.add_argument("--each", action="store_true", \
+                        help="run one job per export instead of a single " \
+                        "batch, each saving to a directory of its own in " \
+                        "--output")
+    parser.add_argument("--manifest", metavar="FILE", \
+                        help="run the jobs in FILE, one command line (e.g. " \
+                        "'Korpus.TXT -s byDate -o out') per line")
+    parser.add_argument("--profile", action="store_true", \
+                        help="print the time, throughput and peak memory of " \
+                        "every stage as JSON")
+    parser.add_argument("--profile-stage", metavar="STAGE", \
+                        choices=LexisNexisProfiler.knownStages, \
+                        help="run --profile-tool around this stage, one of " \
+                        "%(choices)s")
+    parser.add_argument("--profile-tool", default="cprofile", \
+                        choices=LexisNexisProfiler.tools, \
+                        help="hook for --profile-stage (default: %(default)s)")
+    return parser
+
+def _jobs(parser, args):
+    if args.manifest is not None:
+        jobs = []
+        with open(args.manifest, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                argv = shlex.split(line, comments=True)
+                if len(argv) == 0:
+                    continue
+                job = parser.parse_args(argv)
+                if job.manifest is not None or job.each is True:
+                    parser.error("line %d of %s: jobs can't use --manifest " \
+                                 "or --each" % (number, args.manifest))
+                job.name = "%s:%d" % (os.path.basename(args.manifest), number)
+                jobs.append(job)
+        return jobs
+    # Every line of a manifest is parsed like our own command line, so jobs
+    # are checked just as strictly. Empty lines and # comments are skipped.
+
+    jobs = []
+    names = set()
+    for path in _expand_corpora(args.corpus):
+        name = os.path.splitext(os.path.basename(path))[0]
+        while name in names:
+            name += "_"
+        names.add(name)
+        job = argparse.Namespace(**vars(args))
+        job.corpus = [path]
+        job.name = name
+        job.output = os.path.join(args.output, name)
+        for option in ["errors", "export", "groups", "frequency"]:
+            if getattr(args, option) is not None:
+                setattr(job, option, os.path.join(job.output, \
+                        os.path.basename(getattr(args, option))))
+        jobs.append(job)
+    return jobs
+    # With --each every export becomes a job saving to a directory named
+    # after it, the files we've been asked to write go in there too.
+
+def _run(args):
+    for path in [args.errors, args.export, args.groups, args.frequency]:
+        if path is not None and os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Jobs of a queue write these into their own output directory, which
+    # nothing else creates unless articles are saved there.
+
+    profiler = None
+    if args.profile or args.profile_stage is not None:
+        profiler = LexisNexisProfiler(args.profile_stage, args.profile_tool)
+
+    if len(args.corpus) == 1 and os.path.isfile(args.corpus[0]):
+        splitter = LexisNexisSplitter(None, args.corpus[0], None, \
+                                      workers=args.workers, profiler=profiler, \
+                                      compact=args.compact, dedup=args.dedup, \
+                                      profile=args.parser)
+    else:
+        splitter = LexisNexisBatchSplitter(None, args.corpus, None, \
+                                           workers=args.workers, \
+                                           profiler=profiler, \
+                                           compact=args.compact, \
+                                           dedup=args.dedup, \
+                                           profile=args.parser)
+    # Several files, directories or glob patterns are ingested as a batch.
+
+    if args.dedup is not None:
+        splitter.deduplicator = LexisNexisDeduplicator(args.dedup_threshold)
+
+    filtered = args.start is not None or args.end is not None or \
+               args.medium is not None
+    articles = None
+    counted = None
+    if args.update is not None:
+        mode = args.save
+        if mode is None:
+            mode = os.path.basename(os.path.normpath(args.update)) \
+                   .split("_")[0]
+        # Saved trees are named after their mode, e.g. byDate_20160101120000.
+
+        splitter._load_fingerprints(args.update)
+        newArticles = splitter._update_corpus()
+        splitter._save_new_articles(mode, args.update, args.separator, \
+                                    newArticles, container=args.container)
+        counted = splitter.articles
+        # Only what we've added to the tree is grouped and counted.
+    elif filtered and (args.save is not None or args.export is not None or \
+                       args.groups is not None or args.frequency is not None):
+        splitter._process_corpus()
+        articles = splitter._query_articles(args.start, args.end, args.medium)
+        counted = articles
+        if args.save is not None:
+            splitter._save_articles(args.save, args.output, args.separator, \
+                                    articles=articles, \
+                                    container=args.container)
+    # Split everything once, then only save the slice we've been asked for.
+
+    elif args.save is not None:
+        splitter._process_corpus(mode=args.save, path=args.output, \
+                                 docSeparator=args.separator, \
+                                 container=args.container)
+    elif args.groups is not None or args.frequency is not None:
+        splitter._process_corpus()
+    else:
+        splitter._split_corpus()
+    # Only group and count when something needs the groups or frequencies.
+
+    if args.export is not None:
+        splitter._export_articles(args.export, articles)
+    if args.groups is not None:
+        splitter._export_groups(args.groups, counted)
+    if args.frequency is not None:
+        splitter._export_frequency(args.frequency, periods[args.period], \
+                                   counted)
+    if not hasattr(splitter, "articlesByDate"):
+        splitter._collect_errors()
+    # Articles are only reported while they're grouped, which a plain split
+    # or export doesn't do.
+
+    if len(splitter.errors) > 0:
+        print(str(len(splitter.errors)) + " articles with malformed headers", \
+              file=sys.stderr)
+    if args.errors is not None:
+        splitter.errors._write(args.errors)
+    if profiler is not None:
+        print(profiler._json())
     return splitter
     
+
+def _run_job(args):
+    start = time.perf_counter()
+    splitter = _run(args)
+    return {"name": args.name, "articles": len(splitter.articles), \
+            "errors": len(splitter.errors), \
+            "seconds": time.perf_counter() - start}
+    # Runs in a worker process, the splitter itself stays there.
+
+def _run_jobs(jobs, workers):
+    if workers is None or workers < 1:
+        workers = os.cpu_count()
+    results = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs) or 1)) as \
+         executor:
+        futures = {executor.submit(_run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"name": futures[future].name, \
+                          "error": type(e).__name__ + ": " + str(e)}
+                print("[%d/%d] %s failed: %s" % (len(results) + 1, \
+                      len(jobs), result["name"], result["error"]), \
+                      file=sys.stderr)
+            else:
+                print("[%d/%d] %s: %d articles, %d errors in %.1fs" % \
+                      (len(results) + 1, len(jobs), result["name"], \
+                      result["articles"], result["errors"], \
+                      result["seconds"]), file=sys.stderr)
+            results.append(result)
+    return results
+    # Never more than workers jobs run at once, each in a process of its
+    # own. A failing job is reported and doesn't stop the others.
+
+def main(args=None):
+    parser = _parser()
+    args = parser.parse_args(args)
+    if args.manifest is None and args.each is False:
+        return _run(args)
+    return _run_jobs(_jobs(parser, args), args.jobs)
+    # A single job runs right here and hands back its splitter, a queue of
+    # them hands back one summary per job in the order they finished.
+
 if __name__ == "__main__":
     splitter = main()
+    if isinstance(splitter, list) and any("error" in job for job in \
+                                          splitter):
+        sys.exit(1)
@@ -0,0 +1,224 @@
+import sys, os, json, random, argparse, platform, tempfile, shutil
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from NexisSplit import LexisNexisSplitter, LexisNexisProfiler, \
+                       LexisNexisWriter, regex, months
+
+weekdays = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag", \
+            "Samstag", "Sonntag"]
+media = ["Süddeutsche Zeitung", "Die Welt", "taz, die tageszeitung", \
+         "Frankfurter Rundschau", "Der Spiegel", "Frankfurter Allgemeine " \
+         "Zeitung", "Die Zeit", "Handelsblatt", "Berliner Zeitung", \
+         "Der Tagesspiegel", "Stuttgarter Zeitung", "Hamburger Abendblatt"]
+sections = ["Politik", "Wirtschaft", "Feuilleton", "Sport", "Meinung", \
+            "Lokales", "Wissen"]
+words = ["die", "der", "und", "in", "den", "von", "zu", "das", "mit", "sich", \
+         "des", "auf", "für", "ist", "im", "dem", "nicht", "ein", "eine", \
+         "als", "auch", "es", "an", "werden", "aus", "er", "hat", "dass", \
+         "sie", "nach", "Regierung", "Bundestag", "Unternehmen", "Berlin", \
+         "Prozent", "Jahr", "Millionen", "Euro", "Stadt", "Menschen", \
+         "sagte", "müssen", "über", "Straße", "Größe", "Änderung"]
+sizes = [1000, 100000, 1000000]
+saveModes = ["byNumber", "byDate", "byMedium"]
+
+class LexisNexisCorpusGenerator():
+    version = 2
+    # Bump this whenever the generated corpora change, so stale ones kept
+    # by LexisNexisBenchmark aren't used any more.
+
+    def __init__(self, articles, seed=1, batchSize=500, startYear=2014, \
+                 years=3):
+        super(LexisNexisCorpusGenerator, self).__init__()
+        self.articles = articles
+        self.seed = seed
+        self.batchSize = batchSize
+        self.startYear = startYear
+        self.years = years
+        # LexisNexis hands out at most 500 articles per download, so a big
+        # corpus is a concatenation of many exports whose numbering starts
+        # over at "Dokument 1 von ...".
+
+    def _write(self, path):
+        rng = random.Random(self.seed)
+        with open(path, "w", encoding="utf-8") as f:
+            for number in range(self.articles):
+                if number % self.batchSize == 0:
+                    f.write("\ufeff\n\n")
+                # Every export starts with a BOM of its own, so all but the
+                # first end up in the middle of the corpus.
+
+                batchStart = number - number % self.batchSize
+                batchLength = min(self.batchSize, self.articles - batchStart)
+                f.write("".join(self._article(rng, number - batchStart + 1, \
+                                              batchLength)))
+        return path
+        # Seeded with self.seed the very same corpus is written every time,
+        # so benchmarks of different releases process identical input.
+
+    def _article(self, rng, number, batchLength):
+        lines = [" " * 30 + "Dokument %d von %d\n\n" % (number, batchLength)]
+        lines.append(" " * 26 + rng.choice(media) + "\n\n")
+        date = "%d. %s %d" % (rng.randint(1, 28), rng.choice(months), \
+                              self.startYear + rng.randrange(self.years))
+        if rng.random() < 0.5:
+            date = rng.choice(weekdays) + ", " + date
+        lines.append(" " * 26 + date + "\n\n")
+        # Medium and date sit on the first two lines, sometimes with and
+        # sometimes without the day of the week in front of the date.
+
+        lines.append("RUBRIK: %s; S. %d\n\n" % (rng.choice(sections), \
+                                                rng.randint(1, 40)))
+        paragraphs = rng.randint(2, 8)
+        length = 0
+        for paragraph in range(paragraphs):
+            sentence = " ".join(rng.choice(words) for word in \
+                                range(rng.randint(8, 40)))
+            length += len(sentence.split())
+            lines.append(sentence[0].upper() + sentence[1:] + ".\n")
+            if rng.random() < 0.3:
+                lines.append("   \n\n")
+            else:
+                lines.append("\n")
+        # Blank lines and lines holding nothing but whitespace show up all
+        # over real exports.
+
+        lines.append("LÄNGE: %d Wörter\n\n" % length)
+        lines.append("SPRACHE: GERMAN\n\n\n")
+        return lines
+
+class LexisNexisBenchmark():
+    def __init__(self, dataDir=None, seed=1, container="files"):
+        super(LexisNexisBenchmark, self).__init__()
+        if dataDir is None:
+            dataDir = os.path.join(os.path.expanduser("~"), ".cache", \
+                                   "NexisSplit", "benchmark")
+        self.dataDir = dataDir
+        self.seed = seed
+        self.container = container
+        os.makedirs(self.dataDir, exist_ok=True)
+
+    def _corpus(self, articles):
+        path = os.path.join(self.dataDir, "Korpus_%d_%d_v%d.TXT" % \
+                            (articles, self.seed, \
+                             LexisNexisCorpusGenerator.version))
+        if not os.path.isfile(path):
+            LexisNexisCorpusGenerator(articles, self.seed)._write(path + \
+                                                                  ".part")
+            os.replace(path + ".part", path)
+        return path
+        # Generating a million articles takes a while, keep them around for
+        # the next run.
+
+    def _run(self, articles):
+        path = self._corpus(articles)
+        profiler = LexisNexisProfiler()
+        splitter = LexisNexisSplitter(regex, path, months, profiler=profiler)
+        splitter._split_corpus()
+        splitter._group_articles_by_date()
+        splitter._group_articles_by_medium()
+        splitter._prepare_frequency_plotting()
+        stages = profiler._report()["stages"]
+
+        targetDir = tempfile.mkdtemp(prefix="NexisSplitBenchmark_")
+        try:
+            for mode in saveModes:
+                splitter.profiler = LexisNexisProfiler()
+                splitter._save_articles(mode, os.path.join(targetDir, mode), \
+                                        "Dokument 999 von 999", \
+                                        container=self.container)
+                for record in splitter.profiler._report()["stages"]:
+                    record["stage"] = "save_" + mode
+                    stages.append(record)
+        finally:
+            shutil.rmtree(targetDir, ignore_errors=True)
+        # Every mode gets a profiler of its own, otherwise all of them would
+        # add up in a single "save" stage.
+
+        return {"articles": articles, "corpusBytes": os.path.getsize(path), \
+                "stages": stages}
+
+    def _run_all(self, sizes):
+        results = []
+        for articles in sizes:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                results.append(executor.submit(self._run, articles).result())
+        # Run every size in a fresh process, the peak memory the profiler
+        # reports only ever grows within a process.
+
+        return {"python": platform.python_version(), \
+                "platform": platform.platform(), "cpus": os.cpu_count(), \
+                "numpy": np.__version__, "pandas": pd.__version__, \
+                "seed": self.seed, "container": self.container, \
+                "results": results}
+
+def _compare(report, baseline, tolerance):
+    regressions = []
+    previous = {(result["articles"], record["stage"]): record for result in \
+                baseline["results"] for record in result["stages"]}
+    for result in report["results"]:
+        for record in result["stages"]:
+            old = previous.get((result["articles"], record["stage"]))
+            if old is None or old["seconds"] <= 0:
+                continue
+            change = record["seconds"] / old["seconds"] - 1
+            if change > tolerance:
+                regressions.append("%s at %d articles: %.3fs -> %.3fs " \
+                                   "(%+.0f%%)" % (record["stage"], \
+                                   result["articles"], old["seconds"], \
+                                   record["seconds"], change * 100))
+    return regressions
+    # Only time is compared, throughput follows from it and memory depends
+    # too much on the machine.
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark NexisSplit on " \
+                                     "synthetic LexisNexis exports.")
+    parser.add_argument("-n", "--sizes", type=int, nargs="+", default=sizes, \
+                        help="numbers of articles to benchmark " \
+                        "(default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, \
+                        help="seed of the corpus generator " \
+                        "(default: %(default)s)")
+    parser.add_argument("-d", "--data", \
+                        help="directory to keep the generated corpora in " \
+                        "(default: ~/.cache/NexisSplit/benchmark)")
+    parser.add_argument("-c", "--container", default="files", \
+                        choices=LexisNexisWriter.containers, \
+                        help="container to save the articles in " \
+                        "(default: %(default)s)")
+    parser.add_argument("-o", "--output", \
+                        help="write the results to this JSON file")
+    parser.add_argument("-b", "--baseline", \
+                        help="results of an earlier run to compare against")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.2, \
+                        help="slowdown that counts as a regression " \
+                        "(default: %(default)s)")
+    parser.add_argument("--generate", metavar="PATH", \
+                        help="only write a corpus of the first size to PATH")
+    args = parser.parse_args(args)
+
+    if args.generate is not None:
+        LexisNexisCorpusGenerator(args.sizes[0], args.seed)._write( \
+                                                                args.generate)
+        return 0
+
+    benchmark = LexisNexisBenchmark(args.data, args.seed, args.container)
+    report = benchmark._run_all(args.sizes)
+    text = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = _compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("Regression:", regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
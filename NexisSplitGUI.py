@@ -8,10 +8,14 @@ import matplotlib
 matplotlib.use("Qt5Agg")
 
 import NexisSplit
-import sys, codecs
+import sys, os
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import matplotlib.dates as mdates
 
-from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QFileDialog, QPushButton, QLineEdit, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QSizePolicy
+from PyQt5.QtCore import pyqtSignal, QThread, Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QFileDialog, QPushButton, QLineEdit, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QSizePolicy, QSpinBox, QTableView, QHeaderView, QAbstractItemView, QCheckBox, QComboBox
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
@@ -22,8 +26,13 @@ class MainWindow(QWidget):
         super(MainWindow, self).__init__()
         self.regex = "Dokument\ [0-9]{1,3}\ von\ [0-9]{1,3}"
         self.months = ["Januar","Februar","März","April","Mai","Juni","Juli","August","September","Oktober","November","Dezember"]
-        self._corpus = []
+        self._corpusPaths = []
         self.currentArticleIndex = 0
+        self.browserReady = False
+        self.cache = NexisSplit.LexisNexisCache()
+        # Keep the results of every split on disk, so opening the same corpus
+        # again doesn't have to parse it again.
+
         self.initUI()
         
     def initUI(self):
@@ -33,16 +42,47 @@ class MainWindow(QWidget):
         
         # Add the UI elements to select the corpus files:
         loadFilesButton = QPushButton("Open")
+        profileDescriptor = QLabel("Language of the exports:")
+        self.profileComboBox = QComboBox()
+        self.profileComboBox.addItems(["auto"] + list(NexisSplit.profiles) + \
+                                      ["custom"])
+        # "auto" detects the language of every file on its own, so batches
+        # may mix exports in different languages. Only "custom" splits with
+        # the regex and months below.
         regexEntryFieldDescriptor = QLabel("Regex<a href=\"https://docs.python.org/3/howto/regex.html\">*</a> to split the corpus to:")
         regexEntryFieldDescriptor.setOpenExternalLinks(True)
         self.regexEntryField = QLineEdit(self.regex)
         monthsEntryFieldDescriptor = QLabel("Comma seperated months:")
         self.monthsEntryField = QLineEdit(", ".join(self.months))
+        workersEntryFieldDescriptor = QLabel("Worker processes:")
+        self.workersEntryField = QSpinBox()
+        self.workersEntryField.setRange(1, os.cpu_count())
+        self.workersEntryField.setValue(os.cpu_count())
         splitCorpusButton = QPushButton("Split corpus")
         saveArticlesByNumberButton = QPushButton("Save articles by number")
         saveArticlesByDateButton = QPushButton("Save articles by date")
         saveArticlesByMediumButton = QPushButton("Save articles by medium")
+        self.labelProgress = QLabel("")
+        self.cancelButton = QPushButton("Cancel")
+        self.cancelButton.setEnabled(False)
+        # These buttons start work on our splitter, so they're disabled while
+        # a SplitterWorker is busy with it.
+        self.busyButtons = [loadFilesButton, splitCorpusButton, \
+                            saveArticlesByNumberButton, \
+                            saveArticlesByDateButton, \
+                            saveArticlesByMediumButton]
         labelCorpusDisplay = QLabel("Current article")
+        self.articleModel = ArticleListModel(self)
+        self.articleList = QTableView()
+        self.articleList.setModel(self.articleModel)
+        self.articleList.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.articleList.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.articleList.verticalHeader().hide()
+        self.articleList.verticalHeader().setSectionResizeMode( \
+                                                        QHeaderView.Fixed)
+        self.articleList.horizontalHeader().setStretchLastSection(True)
+        # Every row has the same fixed height, so the view never has to look
+        # at rows outside of its viewport to lay itself out.
         self.labelDate = QLabel("publication date")
         self.labelMedium = QLabel("medium")
         self.articleDisplay = QPlainTextEdit()
@@ -52,6 +92,7 @@ class MainWindow(QWidget):
         self.articleNumberEntryField = QLineEdit("")
         self.labelArticlesLength = QLabel("")
         plotCorpusButton = QPushButton("Plot corpus")
+        self.overlayMediaCheckBox = QCheckBox("Overlay media")
         
         # Create layouts for the main window and add it's widgets,
         # Left side for loading a corpora, displaying their names, setting
@@ -59,15 +100,22 @@ class MainWindow(QWidget):
         # date, medium and just in order of loading.
         leftLayout = QVBoxLayout()
         leftLayout.addWidget(loadFilesButton)
+        leftLayout.addWidget(profileDescriptor)
+        leftLayout.addWidget(self.profileComboBox)
         leftLayout.addWidget(regexEntryFieldDescriptor)
         leftLayout.addWidget(self.regexEntryField)
         leftLayout.addWidget(monthsEntryFieldDescriptor)
         leftLayout.addWidget(self.monthsEntryField)
+        leftLayout.addWidget(workersEntryFieldDescriptor)
+        leftLayout.addWidget(self.workersEntryField)
         leftLayout.addWidget(splitCorpusButton)
         leftLayout.addWidget(saveArticlesByNumberButton)
         leftLayout.addWidget(saveArticlesByDateButton)
         leftLayout.addWidget(saveArticlesByMediumButton)
+        leftLayout.addWidget(self.labelProgress)
+        leftLayout.addWidget(self.cancelButton)
         leftLayout.addWidget(labelCorpusDisplay)
+        leftLayout.addWidget(self.articleList)
         leftLayout.addWidget(self.labelDate)
         leftLayout.addWidget(self.labelMedium)
         leftLayout.addWidget(self.articleDisplay)
@@ -79,6 +127,7 @@ class MainWindow(QWidget):
         # Right side for graph and clustering
         self.rightLayout = QVBoxLayout()
         self.rightLayout.addWidget(plotCorpusButton)
+        self.rightLayout.addWidget(self.overlayMediaCheckBox)
 
         # Combine the layouts into a main layout:
         mainLayout = QHBoxLayout()
@@ -95,10 +144,13 @@ class MainWindow(QWidget):
         saveArticlesByDateButton.clicked.connect(self._save_articles)
         saveArticlesByMediumButton.clicked.connect(self._save_articles)
         plotCorpusButton.clicked.connect(self._draw_plot)
+        self.cancelButton.clicked.connect(self._cancel_worker)
         previousButton.clicked.connect(self._set_current_article)
         nextButton.clicked.connect(self._set_current_article)
         self.articleNumberEntryField.returnPressed.connect( \
                                                 self._set_current_article)
+        self.articleList.selectionModel().currentRowChanged.connect( \
+                                                self._select_article)
         
         # Finally, draw mainWindow:
         self.show()
@@ -119,13 +171,16 @@ class MainWindow(QWidget):
 # write each corpus to tempCorpus and finally display the result
 # in the corpusDisplay widget.
             savePath = selectSaveLocationDialog.selectedFiles()[0]
-            self.splitter._save_articles(mode = mode, path = savePath, \
-                                    docSeparator = "Dokument 999 von 999")
+            splitter = self.splitter
+            self._start_worker(lambda: splitter._save_articles(mode = mode, \
+                    path = savePath, docSeparator = "Dokument 999 von 999"))
 
         
     def _update_variables(self):
         self.regex = self.regexEntryField.text()
         self.months = self.monthsEntryField.text().replace(" ","").split(",")
+        self.profileComboBox.setCurrentText("custom")
+        # Whoever edits the regex or the months wants to split with them.
 
     def _set_current_article(self):
         sender = self.sender()
@@ -156,69 +211,253 @@ class MainWindow(QWidget):
                     self.currentArticleIndex += 1
         # Move forward and backward through our corpus.
 
+        self._show_article()
+
+    def _select_article(self, current, previous):
+        if current.isValid() and current.row() != self.currentArticleIndex:
+            self.currentArticleIndex = current.row()
+            self._show_article()
+        # Clicking or scrolling with the keys through our article list.
+
+    def _show_article(self):
         article = self.splitter.articles[self.currentArticleIndex]
         self.labelDate.setText(article.date)
         self.labelMedium.setText(article.medium)
-        self.articleDisplay.clear()
-        for line in article.text:
-            self.articleDisplay.appendPlainText(line)
+        self.articleDisplay.setPlainText("\n".join(article.text))
         self.articleDisplay.verticalScrollBar().setValue(0)
         self.articleNumberEntryField.setText(str(self.currentArticleIndex + 1))
-        # Lastly, update all the widgets
+        # Lastly, update all the widgets. The text is set at once, appending
+        # it line by line would lay out the display again for every line.
+
+        if self.articleList.currentIndex().row() != self.currentArticleIndex:
+            self.articleList.selectRow(self.currentArticleIndex)
+            self.articleList.scrollTo(self.articleModel.index( \
+                                      self.currentArticleIndex, 0))
         
     def _draw_plot(self):
-        if hasattr(self, "plotCanvas"):
-            self.rightLayout.removeWidget(self.plotCanvas)
-        # Try and delete already exisiting widgets or they will multiply.
+        if not hasattr(self, "splitter") or not hasattr(self.splitter, "df"):
+            return
+        # Nothing to plot before the splitter has counted our articles.
+
+        series = {"articles": self.splitter.df["articles"]}
+        if self.overlayMediaCheckBox.isChecked():
+            byMedium = self.splitter._frequency_by_medium()
+            for medium in byMedium.columns:
+                series[medium] = byMedium[medium]
+        # One line for all articles and, if asked for, one per medium.
 
-        self.plotCanvas = MplCanvas(self.splitter.df["articles"], \
-                                        parent=self)
-        self.rightLayout.addWidget(self.plotCanvas)
+        if not hasattr(self, "plotCanvas"):
+            self.plotCanvas = MplCanvas(parent=self)
+            self.plotToolbar = NavigationToolbar(self.plotCanvas, self)
+            self.rightLayout.addWidget(self.plotToolbar)
+            self.rightLayout.addWidget(self.plotCanvas)
+        self.plotCanvas._plot(series)
+        # Create our canvas once and only hand it new data afterwards, instead
+        # of stacking up a new one on every click.
         
     def _invoke_splitter(self):
-        self.splitter = NexisSplit.LexisNexisSplitter(self.regex,\
-                                           self._corpus, self.months)
-        self.splitter._split_corpus()
-        self.labelArticlesLength.setText("/ " + \
-                                         str(len(self.splitter.articles)))
-        self._set_current_article()
-        self.splitter._group_articles_by_date()
-        self.splitter._group_articles_by_medium()
-        self.splitter._prepare_frequency_plotting()
+        if hasattr(self, "splitter") and isinstance(getattr(self.splitter, \
+                    "articles", None), NexisSplit.LexisNexisArticleIndex):
+            self.splitter.articles._close()
+        # Release the memory map of the previously opened corpus.
+
+        profile = self.profileComboBox.currentText()
+        regex, months = None, None
+        if profile == "custom":
+            regex, months, profile = self.regex, self.months, None
+        # Built-in profiles bring their own regex and months.
+
+        if len(self._corpusPaths) == 1:
+            self.splitter = NexisSplit.LexisNexisSplitter(regex, \
+                            self._corpusPaths[0], months, index=True, \
+                            profile=profile)
+        else:
+            self.splitter = NexisSplit.LexisNexisBatchSplitter(regex, \
+                                           self._corpusPaths, months, \
+                                   workers=self.workersEntryField.value(), \
+                                   profile=profile)
+        # A single corpus file is mapped into memory and only indexed, the
+        # articles are decoded once they're displayed or saved. Multiple files
+        # are streamed one by one (or several at once by our workers) without
+        # ever joining them into one corpus.
+
+        self.browserReady = False
+        self.articleModel._set_articles([])
+        splitter = self.splitter
+        cache = self.cache
+        self._start_worker(lambda: splitter._process_corpus(cache=cache))
+        # Parse, group and count on a background thread, the first articles
+        # show up in the browser while the rest is still being parsed.
+
+    def _start_worker(self, task):
+        self.worker = SplitterWorker(self.splitter, task, parent=self)
+        self.worker.progressed.connect(self._show_progress)
+        self.worker.failed.connect(self._show_failure)
+        self.worker.cancelled.connect(self._show_cancelled)
+        self.worker.finished.connect(self._worker_finished)
+        for button in self.busyButtons:
+            button.setEnabled(False)
+        self.cancelButton.setEnabled(True)
+        self.worker.start()
+
+    def _cancel_worker(self):
+        if hasattr(self, "worker"):
+            self.worker._cancel()
+        self.cancelButton.setEnabled(False)
+        self.labelProgress.setText("Cancelling...")
+
+    def _show_progress(self, stage, count):
+        messages = {"split": " articles parsed", \
+                    "group": " articles grouped", \
+                    "frequency": " articles counted", \
+                    "save": " files written"}
+        self.labelProgress.setText(str(count) + messages[stage])
+        if stage == "split":
+            self.labelArticlesLength.setText("/ " + str(count))
+            self.articleModel._grow(getattr(self.splitter, "articles", []), \
+                                    count)
+            if self.browserReady is False and count > 0:
+                self.browserReady = True
+                self.currentArticleIndex = 0
+                self._set_current_article()
+        # Show the first article as soon as there is one.
+
+    def _show_failure(self, message):
+        self.labelProgress.setText("Failed: " + message)
+
+    def _show_cancelled(self):
+        self.labelProgress.setText("Cancelled")
+
+    def _worker_finished(self):
+        for button in self.busyButtons:
+            button.setEnabled(True)
+        self.cancelButton.setEnabled(False)
+        articles = getattr(self.splitter, "articles", [])
+        self.labelArticlesLength.setText("/ " + str(len(articles)))
+        self.articleModel._grow(articles, len(articles))
+        if self.browserReady is False and len(articles) > 0:
+            self.browserReady = True
+            self.currentArticleIndex = 0
+            self._set_current_article()
         
     def _get_files(self):
-        # Create an empty pseudo file for two reasons:
-        # 1. In order to be able to pass a file instead of an string to
-        #    NexisSplit() [to make NexisSplit usable as a class by itself] and
-        # 2. Do it here instead of globally, so that we overwrite previously
-        #    imported content and thus don't run the risk of importing files
-        #    twice into our corpus.
-        self.corpus = []
+        # Forget previously selected files here instead of globally, so we
+        # don't run the risk of importing files twice into our corpus.
+        self._corpusPaths = []
 
         # Create a dialog to select our corpus files.
         selectCorpusDialog = QFileDialog()
         selectCorpusDialog.setFileMode(QFileDialog.ExistingFiles)
         if selectCorpusDialog.exec_():
             
-        # Save the selection in a list, iterate over it trying to load each
-        # file through the codecs module to better support UTF-8 encoded files,
-        # write each corpus to tempCorpus and finally display the result
-        # in the corpusDisplay widget.
+        # Save the selection in a list and display the names of the selected
+        # files in the corpusDisplay widget. The files themselves are only
+        # read by the splitter.
             self.articleDisplay.clear()
             pathsToCorpora = selectCorpusDialog.selectedFiles()
+            self._corpusPaths = pathsToCorpora
             for pathToCorpus in pathsToCorpora:
-                # We need to append line by line instead of just setting
-                # QPlainTextEdit.setText or '\r\n' will be everywhere.
-                with codecs.open(pathToCorpus, "r") as f:
-                    # for line in f.readlines():
-                    #    self.tempCorpus.append(line)
-                    #    self.corpusDisplay.appendPlainText(line)
-                    self._corpus.extend(f.readlines())
-                    self.articleDisplay. \
-                        appendPlainText(pathToCorpus.split("/")[-1])   
+                self.articleDisplay. \
+                    appendPlainText(pathToCorpus.split("/")[-1])   
+
+class SplitterWorker(QThread):
+    progressed = pyqtSignal(str, int)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, splitter, task, parent=None):
+        super(SplitterWorker, self).__init__(parent)
+        self.splitter = splitter
+        self.task = task
+        self.cancelRequested = False
+
+    def run(self):
+        self.splitter.progress = self._report
+        try:
+            self.task()
+        except NexisSplit.LexisNexisCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            self.splitter.progress = None
+        # Signals are delivered to the main thread, so our widgets are only
+        # ever touched from there.
+
+    def _report(self, stage, count):
+        self.progressed.emit(stage, count)
+        if self.cancelRequested is True:
+            raise NexisSplit.LexisNexisCancelled()
+        # The splitter calls this regularly, which gives us the chance to
+        # stop it in the middle of its work.
+
+    def _cancel(self):
+        self.cancelRequested = True
+
+class ArticleListModel(QAbstractTableModel):
+    headers = ["#", "Date", "Medium"]
+
+    def __init__(self, parent=None, cacheSize=1000):
+        super(ArticleListModel, self).__init__(parent)
+        self.articles = []
+        self.rows = 0
+        self.cache = OrderedDict()
+        self.cacheSize = cacheSize
+        # The view only asks for the rows it shows, remember the date and
+        # medium of the most recent ones so repainting doesn't decode them
+        # again (e.g. from a memory mapped LexisNexisArticleIndex).
+
+    def _set_articles(self, articles, rows=None):
+        self.beginResetModel()
+        self.articles = articles
+        self.rows = len(articles) if rows is None else min(rows, len(articles))
+        self.cache.clear()
+        self.endResetModel()
+
+    def _grow(self, articles, rows):
+        if articles is not self.articles or rows < self.rows:
+            self._set_articles(articles, rows)
+        elif rows > self.rows:
+            rows = min(rows, len(articles))
+            self.beginInsertRows(QModelIndex(), self.rows, rows - 1)
+            self.rows = rows
+            self.endInsertRows()
+        # While the splitter is still parsing only add the rows it has
+        # reported so far. Once it's done its articles may have been replaced
+        # (e.g. by dropping duplicates), then start over.
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.rows
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        row = index.row()
+        if index.column() == 0:
+            return str(row + 1)
+        if row in self.cache:
+            self.cache.move_to_end(row)
+        else:
+            article = self.articles[row]
+            self.cache[row] = (article.date, article.medium)
+            if len(self.cache) > self.cacheSize:
+                self.cache.popitem(last=False)
+        return self.cache[row][index.column() - 1]
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
 
 class MplCanvas(FigureCanvas):
-    def __init__(self, articlesPerDayDF, parent=None):
+    def __init__(self, articlesPerDayDF=None, parent=None):
         self.fig = Figure()
         super(MplCanvas, self).__init__(self.fig)
         self.setParent(parent)
@@ -226,7 +465,82 @@ class MplCanvas(FigureCanvas):
                                    QSizePolicy.Expanding)
         FigureCanvas.updateGeometry(self)        
         self.axes = self.fig.add_subplot(111)
-        self.axes.plot(articlesPerDayDF)
+        self.axes.xaxis_date()
+        self.lines = OrderedDict()
+        self.x = np.array([])
+        self.y = np.empty((0, 0))
+        # Our lines stay the same Line2D artists from plot to plot, only
+        # their data is replaced. x holds the days as matplotlib date numbers,
+        # y one row of counts per line.
+
+        self.axes.callbacks.connect("xlim_changed", self._decimate)
+        self.mpl_connect("resize_event", self._decimate)
+        # Zooming, panning and resizing change how many days end up on a
+        # pixel, so thin out our data again.
+
+        if articlesPerDayDF is not None:
+            self._plot({"articles": articlesPerDayDF})
+
+    def _plot(self, series):
+        frame = pd.DataFrame(series).fillna(0)
+        self.x = mdates.date2num(frame.index.to_numpy())
+        self.y = frame.to_numpy(dtype=float).T
+        lines = OrderedDict()
+        for name in frame.columns:
+            if name in self.lines:
+                lines[name] = self.lines.pop(name)
+            else:
+                lines[name], = self.axes.plot([], [], label=name, \
+                                              linewidth=0.8, antialiased=False, \
+                                              solid_joinstyle="miter")
+                if name == "articles":
+                    lines[name].set(linewidth=2, antialiased=True, \
+                                    solid_joinstyle="round")
+        for line in self.lines.values():
+            line.remove()
+        self.lines = lines
+        # Reuse the lines we already have, add the missing ones and remove
+        # those we don't need anymore. Rasterizing is what's left of the cost
+        # of a redraw, so the per medium lines are drawn without
+        # antialiasing and with cheap joins.
+
+        if self.axes.get_legend() is not None:
+            self.axes.get_legend().remove()
+        if 1 < len(self.lines) <= 20:
+            self.axes.legend(fontsize="small")
+        # A legend with more entries than that would just cover the plot.
+
+        if len(self.x) > 0:
+            self.axes.set_ylim(0, max(self.y.max(), 1) * 1.05)
+            self.axes.set_xlim(self.x[0], self.x[-1])
+        # Setting the limits ourselves is cheaper than autoscaling over all
+        # our data, and it triggers _decimate() for the whole range.
+
+        self.draw_idle()
+
+    def _decimate(self, *args):
+        x0, x1 = self.axes.get_xlim()
+        lo = max(np.searchsorted(self.x, x0) - 1, 0)
+        hi = min(np.searchsorted(self.x, x1) + 1, len(self.x))
+        step = -(-(hi - lo) // max(int(self.axes.bbox.width), 1))
+        if hi <= lo or step <= 2:
+            x, ys = self.x[lo:hi], self.y[:, lo:hi]
+        else:
+            starts = np.arange(lo, hi, step)
+            x = np.repeat(self.x[starts], 2)
+            ys = np.empty((len(self.y), 2 * len(starts)))
+            ys[:, 0::2] = np.minimum.reduceat(self.y[:, lo:hi], starts - lo, \
+                                              axis=1)
+            ys[:, 1::2] = np.maximum.reduceat(self.y[:, lo:hi], starts - lo, \
+                                              axis=1)
+        # Only the days in view (plus one on either side) are drawn. When
+        # there are more of them than pixels, every pixel column gets the
+        # smallest and the largest count of its days, which looks just like
+        # drawing all of them.
+
+        for line, y in zip(self.lines.values(), ys):
+            line.set_data(x, y)
+        self.draw_idle()
 
 def main():
     app = QApplication(sys.argv)